@@ -159,6 +159,9 @@ class VideoClientApp(tk.Tk):
                 if response.status_code == 200:
                     messagebox.showinfo("Sucesso", "Vídeo enviado e processado com sucesso!")
                     self.refresh_history()
+                elif response.status_code == 202:
+                    # Servidor no modo fila: o vídeo aparece na lista quando um worker terminar
+                    messagebox.showinfo("Enviado", "Vídeo enviado! O processamento está na fila.")
                 else:
                     messagebox.showerror("Erro", f"Falha ao enviar vídeo:\n{response.text}")
             except Exception as e:
@@ -0,0 +1,359 @@
+"""
+Teste de carga sem interface: simula vários clientes contra o servidor.
+
+Gera vídeos sintéticos localmente e dispara, em paralelo, uma mistura
+configurável de uploads, listagens (/videos, /videos/search, /gallery) e
+reprodução por Range em /media. Ao final imprime latências (p50/p90/p95/
+p99), vazão e taxas de erro por operação e grava um resumo em JSON para
+comparar configurações do servidor.
+
+Uso:
+    python loadtest.py run --server http://127.0.0.1:5000 --duration 60 --users 8
+    python loadtest.py run --mix upload=1,list=4,search=1,gallery=1,play=6 --out prod.json
+    python loadtest.py compare dev.json prod.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+
+import requests
+
+DEFAULT_MIX = 'upload=1,list=4,search=1,gallery=1,play=6'
+OPERATIONS = ('upload', 'list', 'search', 'gallery', 'play')
+SEARCH_TERMS = ('loadtest', 'gray', 'edges', 'video', 'cena')
+
+
+# =====================================
+# Vídeos sintéticos
+# =====================================
+
+def make_video(path: Path, width: int, height: int, seconds: float, fps: float = 30.0, seed: int = 0):
+    """Gradiente com um objeto em movimento (MJPG, lido por qualquer OpenCV)"""
+    import cv2
+    import numpy as np
+
+    out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    if not out.isOpened():
+        raise RuntimeError("Não foi possível criar o vídeo sintético")
+    rng = np.random.default_rng(seed)
+    base = np.zeros((height, width, 3), np.uint8)
+    base[:] = np.linspace(0, 255, width, dtype=np.uint8)[None, :, None]
+    base[..., rng.integers(0, 3)] //= 2
+    radius = max(min(width, height) // 10, 4)
+    color = tuple(int(c) for c in rng.integers(0, 256, 3))
+    for i in range(int(seconds * fps)):
+        frame = base.copy()
+        cv2.circle(frame, ((i * 8) % width, height // 2), radius, color, -1)
+        out.write(frame)
+    out.release()
+
+
+def make_videos(directory: Path, sizes: list[tuple[int, int]], seconds: float) -> list[Path]:
+    videos = []
+    for i, (width, height) in enumerate(sizes):
+        path = directory / f'loadtest_{width}x{height}.avi'
+        make_video(path, width, height, seconds, seed=i)
+        videos.append(path)
+        print(f"Vídeo sintético: {path.name} ({path.stat().st_size / 2**20:.1f} MiB)")
+    return videos
+
+
+# =====================================
+# Estatísticas
+# =====================================
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+class Recorder:
+    """Amostras por operação: (latência em ms, status HTTP ou None, bytes)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {op: [] for op in OPERATIONS}
+
+    def add(self, op: str, latency_ms: float, status: int | None, nbytes: int = 0):
+        with self._lock:
+            self.samples[op].append((latency_ms, status, nbytes))
+
+    def summary(self, elapsed: float) -> dict:
+        ops = {}
+        for op, samples in self.samples.items():
+            if not samples:
+                continue
+            latencies = [s[0] for s in samples]
+            ok = [s for s in samples if s[1] is not None and s[1] < 400]
+            # 429 é recusa da admissão (ver server/admission.py), não falha
+            rejected = sum(1 for s in samples if s[1] == 429)
+            errors = len(samples) - len(ok) - rejected
+            ops[op] = {
+                'count': len(samples),
+                'rps': round(len(samples) / elapsed, 2),
+                'p50_ms': round(percentile(latencies, 50), 1),
+                'p90_ms': round(percentile(latencies, 90), 1),
+                'p95_ms': round(percentile(latencies, 95), 1),
+                'p99_ms': round(percentile(latencies, 99), 1),
+                'max_ms': round(max(latencies), 1),
+                'mean_ms': round(sum(latencies) / len(latencies), 1),
+                'errors': errors,
+                'rejected': rejected,
+                'error_rate': round(errors / len(samples), 4),
+                'recv_MiB_s': round(sum(s[2] for s in samples) / elapsed / 2**20, 2),
+            }
+
+        total = sum(o['count'] for o in ops.values())
+        errors = sum(o['errors'] for o in ops.values())
+        rejected = sum(o['rejected'] for o in ops.values())
+        return {
+            'requests': total,
+            'rps': round(total / elapsed, 2),
+            'errors': errors,
+            'rejected': rejected,
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'rejected_rate': round(rejected / total, 4) if total else 0.0,
+            'ops': ops,
+        }
+
+
+# =====================================
+# Clientes simulados
+# =====================================
+
+class Client:
+    """Um usuário simulado: sessão HTTP própria e um cache de vídeos conhecidos"""
+
+    def __init__(self, args, videos: list[Path], recorder: Recorder, catalog: list, seed: int):
+        self.args = args
+        self.server = args.server.rstrip('/')
+        self.videos = videos
+        self.recorder = recorder
+        self.catalog = catalog
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+
+    def timed(self, op: str, method: str, url: str, **kwargs) -> requests.Response | None:
+        t0 = time.perf_counter()
+        try:
+            resp = self.session.request(method, url, timeout=self.args.timeout, **kwargs)
+            body = resp.content
+        except requests.RequestException:
+            self.recorder.add(op, (time.perf_counter() - t0) * 1000, None)
+            return None
+        self.recorder.add(op, (time.perf_counter() - t0) * 1000, resp.status_code, len(body))
+        return resp
+
+    def op_upload(self):
+        video = self.rng.choice(self.videos)
+        with open(video, 'rb') as f:
+            resp = self.timed('upload', 'POST', f'{self.server}/upload',
+                              files={'video': (video.name, f)},
+                              data={'filter': self.rng.choice(self.args.filters)})
+        if resp is not None and resp.status_code == 200:
+            self.catalog.append(resp.json())
+
+    def op_list(self):
+        resp = self.timed('list', 'GET', f'{self.server}/videos')
+        if resp is not None and resp.status_code == 200:
+            videos = resp.json()
+            if videos:
+                self.catalog[:] = videos
+
+    def op_search(self):
+        self.timed('search', 'GET', f'{self.server}/videos/search',
+                   params={'q': self.rng.choice(SEARCH_TERMS), 'limit': 50})
+
+    def op_gallery(self):
+        self.timed('gallery', 'GET', f'{self.server}/gallery')
+
+    def op_play(self):
+        """Início do vídeo e um seek, como um player com Range"""
+        if not self.catalog:
+            return self.op_list()
+        video = self.rng.choice(self.catalog)
+        url = video.get('processed') or video.get('urls', {}).get('processed')
+        if not url:
+            return
+        chunk = self.args.range_kb * 1024
+        resp = self.timed('play', 'GET', url, headers={'Range': f'bytes=0-{chunk - 1}'})
+        total = None
+        if resp is not None and resp.status_code == 206:
+            total = int(resp.headers.get('Content-Range', '/0').rsplit('/', 1)[-1] or 0)
+        if total and total > chunk:
+            start = self.rng.randrange(0, total - chunk)
+            self.timed('play', 'GET', url, headers={'Range': f'bytes={start}-{start + chunk - 1}'})
+
+    def run(self, deadline: float, ops: list[str], weights: list[float]):
+        while time.monotonic() < deadline:
+            getattr(self, f'op_{self.rng.choices(ops, weights)[0]}')()
+            if self.args.think_ms:
+                time.sleep(self.rng.uniform(0, 2 * self.args.think_ms) / 1000)
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(','):
+        op, _, weight = item.partition('=')
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError(f"Operação desconhecida: {op} (use {', '.join(OPERATIONS)})")
+        mix[op] = float(weight or 1)
+    return {op: w for op, w in mix.items() if w > 0}
+
+
+def parse_sizes(text: str) -> list[tuple[int, int]]:
+    return [tuple(int(v) for v in s.lower().split('x')) for s in text.split(',')]
+
+
+def run_load(args) -> dict:
+    mix = parse_mix(args.mix)
+    with tempfile.TemporaryDirectory() as tmp:
+        videos = make_videos(Path(tmp), parse_sizes(args.sizes), args.video_seconds) if 'upload' in mix else []
+
+        recorder = Recorder()
+        catalog = []
+        # Semente do catálogo para os primeiros plays
+        try:
+            catalog.extend(requests.get(f"{args.server.rstrip('/')}/videos", timeout=args.timeout).json())
+        except (requests.RequestException, ValueError) as e:
+            print(f"Não foi possível listar os vídeos iniciais: {e}")
+
+        clients = [Client(args, videos, recorder, catalog, args.seed + i) for i in range(args.users)]
+        print(f"{args.users} clientes por {args.duration}s contra {args.server} (mistura {mix})")
+        started_at = datetime.now(timezone.utc).isoformat()
+        t0 = time.monotonic()
+        deadline = t0 + args.duration
+        threads = [
+            threading.Thread(target=c.run, args=(deadline, list(mix), list(mix.values())), daemon=True)
+            for c in clients
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - t0
+
+    return {
+        'label': args.label,
+        'server': args.server,
+        'started_at': started_at,
+        'duration_sec': round(elapsed, 2),
+        'config': {
+            'users': args.users, 'mix': mix, 'sizes': args.sizes, 'video_seconds': args.video_seconds,
+            'filters': args.filters, 'range_kb': args.range_kb, 'think_ms': args.think_ms,
+        },
+        **recorder.summary(elapsed),
+    }
+
+
+# =====================================
+# Relatórios
+# =====================================
+
+def print_table(rows: list[dict]):
+    if not rows:
+        return
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+def print_summary(summary: dict):
+    print(f"\n{summary['label'] or summary['server']}: {summary['requests']} requisições em "
+          f"{summary['duration_sec']}s ({summary['rps']} req/s), erros {summary['error_rate']:.2%}, "
+          f"recusadas (429) {summary['rejected_rate']:.2%}")
+    print_table([
+        {'operação': op, **{k: v for k, v in stats.items() if k != 'error_rate'}}
+        for op, stats in summary['ops'].items()
+    ])
+
+
+def _delta(old: float, new: float) -> str:
+    if not old:
+        return '-'
+    return f'{(new - old) / old:+.0%}'
+
+
+def compare(base: dict, other: dict):
+    """Lado a lado por operação: vazão, p50/p95/p99 e taxa de erro"""
+    print(f"\nBase: {base['label'] or base['server']}  x  Novo: {other['label'] or other['server']}")
+    rows = []
+    for op in OPERATIONS:
+        a, b = base['ops'].get(op), other['ops'].get(op)
+        if not a or not b:
+            continue
+        row = {'operação': op}
+        for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            row[key] = f"{a[key]} -> {b[key]} ({_delta(a[key], b[key])})"
+        row['erros'] = f"{a['error_rate']:.2%} -> {b['error_rate']:.2%}"
+        rows.append(row)
+    rows.append({
+        'operação': 'total',
+        'rps': f"{base['rps']} -> {other['rps']} ({_delta(base['rps'], other['rps'])})",
+        'p50_ms': '', 'p95_ms': '', 'p99_ms': '',
+        'erros': f"{base['error_rate']:.2%} -> {other['error_rate']:.2%}",
+    })
+    print_table(rows)
+
+
+# =====================================
+# Entrypoint
+# =====================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do servidor de vídeos")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p = sub.add_parser('run', help="executa a carga e grava o resumo")
+    p.add_argument('--server', default=os.getenv('LOADTEST_SERVER', 'http://127.0.0.1:5000'))
+    p.add_argument('--duration', type=float, default=30.0, help="segundos de carga")
+    p.add_argument('--users', type=int, default=8, help="clientes simultâneos")
+    p.add_argument('--mix', default=DEFAULT_MIX, help="pesos por operação, ex.: upload=1,list=4,play=6")
+    p.add_argument('--sizes', default='320x240,640x360', help="resoluções dos vídeos sintéticos")
+    p.add_argument('--video-seconds', type=float, default=3.0)
+    p.add_argument('--filters', type=lambda s: s.split(','), default=['gray', 'edges', 'pixelate'])
+    p.add_argument('--range-kb', type=int, default=256, help="tamanho de cada Range do play")
+    p.add_argument('--think-ms', type=float, default=0.0, help="pausa média entre operações")
+    p.add_argument('--timeout', type=float, default=120.0)
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--label', default='', help="nome da configuração no relatório")
+    p.add_argument('--out', type=Path, help="grava o resumo em JSON")
+
+    p = sub.add_parser('compare', help="compara dois resumos JSON")
+    p.add_argument('base', type=Path)
+    p.add_argument('other', type=Path)
+
+    args = parser.parse_args()
+
+    if args.cmd == 'compare':
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.other) as f:
+            other = json.load(f)
+        compare(base, other)
+        return
+
+    summary = run_load(args)
+    print_summary(summary)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(summary, f, indent=4)
+        print(f"Resumo gravado em {args.out}")
+    if summary['requests'] == 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
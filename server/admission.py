@@ -0,0 +1,234 @@
+import os
+import time
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# A estimativa de memória usa as mesmas configurações do processamento:
+# frames guardados para o preview e slots do FrameRing por worker
+from previews import PREVIEW_MAX_FRAMES, PREVIEW_WIDTH
+from processing import PIPELINE_WORKERS, RING_SLOTS_PER_WORKER
+
+# Orçamentos globais (por processo) para jobs de processamento
+MAX_JOBS = int(os.getenv('ADMISSION_MAX_JOBS', str(os.cpu_count() or 1)))
+MAX_MEMORY_MB = int(os.getenv('ADMISSION_MAX_MEMORY_MB', '2048'))
+MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '16'))
+MAX_WAIT_SEC = float(os.getenv('ADMISSION_MAX_WAIT', '30'))
+
+# Quantos buffers de frame um job mantém vivos ao mesmo tempo
+# (decode, resize, filtro e intermediários do cvtColor)
+FRAME_BUFFERS = 6
+# Depois de AGING_SEC na fila, a prioridade de um job longo dobra
+AGING_SEC = 10.0
+
+
+class AdmissionRejected(Exception):
+    """Job recusado: servidor acima do orçamento ou fila cheia"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def estimate_cost(info: dict) -> dict:
+    """
+    Estima o custo de um job a partir das propriedades do vídeo
+    (ver processing.probe_video).
+    """
+    width, height = info['width'], info['height']
+    frames = max(info.get('frame_count') or 0, 1)
+
+    frame_bytes = width * height * 3
+    preview_bytes = (PREVIEW_MAX_FRAMES + 1) * PREVIEW_WIDTH * (PREVIEW_WIDTH * height // max(width, 1)) * 3
+    pipeline_buffers = (PIPELINE_WORKERS * (RING_SLOTS_PER_WORKER + FRAME_BUFFERS) + 2
+                        if PIPELINE_WORKERS else 0)
+
+    return {
+        'pixels': width * height * frames,
+        'memory_bytes': frame_bytes * (FRAME_BUFFERS + pipeline_buffers) + preview_bytes,
+    }
+
+
+class Ticket:
+    def __init__(self, job_id: str, cost: dict, seq: int):
+        self.job_id = job_id
+        self.cost = cost
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+
+    def priority(self, now: float) -> float:
+        # Clipes curtos primeiro; o envelhecimento evita starvation
+        waited = now - self.enqueued_at
+        return self.cost['pixels'] / (1.0 + waited / AGING_SEC)
+
+
+class AdmissionController:
+    """
+    Controla quantos jobs de processamento rodam ao mesmo tempo.
+
+    Cada job declara um custo (pixels a processar e memória estimada).
+    Se couber nos orçamentos de CPU (slots) e memória, roda na hora;
+    caso contrário espera numa fila por prioridade (menor custo primeiro)
+    até MAX_WAIT_SEC, ou é recusado com um Retry-After estimado.
+    """
+
+    def __init__(self, max_jobs: int = MAX_JOBS, max_memory_mb: int = MAX_MEMORY_MB,
+                 max_queue: int = MAX_QUEUE, max_wait: float = MAX_WAIT_SEC):
+        self.max_jobs = max(max_jobs, 1)
+        self.max_memory = max_memory_mb * 1024 * 1024
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._running = {}
+        self._waiting = []
+        self._memory_in_use = 0
+        # Vazão observada (pixels/s por job), média móvel exponencial
+        self._pixels_per_sec = None
+
+        self._counters = {'admitted': 0, 'queued': 0, 'rejected': 0, 'completed': 0}
+        self._decisions = deque(maxlen=50)
+
+    # ---------------------------------
+    # Decisões
+    # ---------------------------------
+
+    def _job_memory(self, ticket: Ticket) -> int:
+        # Um job maior que o orçamento inteiro só roda com o servidor ocioso
+        return min(ticket.cost['memory_bytes'], self.max_memory)
+
+    def _fits(self, ticket: Ticket) -> bool:
+        if len(self._running) >= self.max_jobs:
+            return False
+        return self._memory_in_use + self._job_memory(ticket) <= self.max_memory
+
+    def _next_in_line(self):
+        if not self._waiting:
+            return None
+        now = time.monotonic()
+        return min(self._waiting, key=lambda t: (t.priority(now), t.seq))
+
+    def _start(self, ticket: Ticket):
+        ticket.started_at = time.monotonic()
+        self._running[ticket.seq] = ticket
+        self._memory_in_use += self._job_memory(ticket)
+        self._counters['admitted'] += 1
+
+    def _record(self, ticket: Ticket, decision: str, detail: str = ''):
+        self._decisions.append({
+            'job_id': ticket.job_id,
+            'decision': decision,
+            'detail': detail,
+            'pixels': ticket.cost['pixels'],
+            'memory_bytes': ticket.cost['memory_bytes'],
+            'at': time.time(),
+        })
+
+    def retry_after(self) -> int:
+        """Estimativa (s) de quando haverá capacidade livre"""
+        if not self._pixels_per_sec:
+            return 5
+        now = time.monotonic()
+        pending = 0.0
+        for t in self._running.values():
+            done = (now - t.started_at) * self._pixels_per_sec
+            pending += max(t.cost['pixels'] - done, 0)
+        pending += sum(t.cost['pixels'] for t in self._waiting)
+        seconds = pending / (self._pixels_per_sec * self.max_jobs)
+        return int(min(max(seconds, 1), 300))
+
+    def acquire(self, job_id: str, cost: dict) -> Ticket:
+        """Bloqueia até o job poder rodar ou lança AdmissionRejected"""
+        with self._cond:
+            ticket = Ticket(job_id, cost, next(self._seq))
+
+            if not self._waiting and self._fits(ticket):
+                self._start(ticket)
+                self._record(ticket, 'admitted')
+                return ticket
+
+            if len(self._waiting) >= self.max_queue:
+                self._counters['rejected'] += 1
+                self._record(ticket, 'rejected', 'fila cheia')
+                raise AdmissionRejected("Fila de processamento cheia", self.retry_after())
+
+            self._waiting.append(ticket)
+            self._counters['queued'] += 1
+            self._record(ticket, 'queued')
+
+            deadline = ticket.enqueued_at + self.max_wait
+            while True:
+                if self._next_in_line() is ticket and self._fits(ticket):
+                    self._waiting.remove(ticket)
+                    self._start(ticket)
+                    self._record(ticket, 'admitted', 'após fila')
+                    # Outro job da fila pode caber também
+                    self._cond.notify_all()
+                    return ticket
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self._counters['rejected'] += 1
+                    self._record(ticket, 'rejected', 'tempo de espera esgotado')
+                    self._cond.notify_all()
+                    raise AdmissionRejected("Servidor ocupado, tente novamente", self.retry_after())
+                self._cond.wait(remaining)
+
+    def release(self, ticket: Ticket):
+        with self._cond:
+            if self._running.pop(ticket.seq, None) is None:
+                return
+            self._memory_in_use -= self._job_memory(ticket)
+            self._counters['completed'] += 1
+
+            elapsed = time.monotonic() - ticket.started_at
+            if elapsed > 0 and ticket.cost['pixels'] > 0:
+                rate = ticket.cost['pixels'] / elapsed
+                if self._pixels_per_sec is None:
+                    self._pixels_per_sec = rate
+                else:
+                    self._pixels_per_sec = 0.8 * self._pixels_per_sec + 0.2 * rate
+
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, job_id: str, cost: dict):
+        ticket = self.acquire(job_id, cost)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    # ---------------------------------
+    # Monitoramento
+    # ---------------------------------
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            return {
+                'limits': {
+                    'max_jobs': self.max_jobs,
+                    'max_memory_bytes': self.max_memory,
+                    'max_queue': self.max_queue,
+                    'max_wait_sec': self.max_wait,
+                },
+                'running': [
+                    {'job_id': t.job_id, 'running_sec': round(now - t.started_at, 2), **t.cost}
+                    for t in self._running.values()
+                ],
+                'waiting': [
+                    {'job_id': t.job_id, 'waiting_sec': round(now - t.enqueued_at, 2), **t.cost}
+                    for t in sorted(self._waiting, key=lambda t: (t.priority(now), t.seq))
+                ],
+                'memory_in_use_bytes': self._memory_in_use,
+                'pixels_per_sec': self._pixels_per_sec,
+                'retry_after': self.retry_after(),
+                'counters': dict(self._counters),
+                'recent_decisions': list(self._decisions),
+            }
@@ -1,185 +1,131 @@
-import os
+import math
 import uuid
 import json
+import threading
 from pathlib import Path
-from datetime import datetime, timezone
 from flask import (
-    Flask, request, jsonify, send_from_directory,
+    Flask, Blueprint, request, jsonify, send_from_directory,
     abort, render_template_string, redirect, url_for,
     render_template, flash
 )
-from dotenv import load_dotenv
 import cv2
-import tempfile
+import shutil
 
-from db import init_db, insert_video, list_videos, get_video, delete_video_db
-from processing import process_video
-from utils import now_parts, safe_ext, sha256sum, guess_mime
-
-load_dotenv()
-
-MEDIA_ROOT = Path(os.getenv('MEDIA_ROOT', './media')).resolve()
-HOST = os.getenv('HOST', '0.0.0.0')
-PORT = int(os.getenv('PORT', '5000'))
-DEBUG = bool(int(os.getenv('DEBUG', '1')))
-
-INCOMING = MEDIA_ROOT / 'incoming'
-TRASH = MEDIA_ROOT / 'trash'
-VIDEOS = MEDIA_ROOT / 'videos'
-
-for p in (MEDIA_ROOT, INCOMING, TRASH, VIDEOS):
-    p.mkdir(parents=True, exist_ok=True)
-
-app = Flask(__name__)
-init_db()
+from config import (
+    MEDIA_ROOT, HOST, PORT, DEBUG, INCOMING, TRASH, VIDEOS, WRITE_META_JSON, PROCESSING_MODE, server_processes,
+)
+from db import (
+    init_db, list_videos, get_video, delete_video_db, search_videos,
+    claim_idempotency_key, release_idempotency_key, VIDEO_COLUMNS,
+)
+from processing import probe_video, clip_bounds, SKIP_DIFF_THRESHOLD
+from admission import AdmissionController, AdmissionRejected, estimate_cost
+from encoders import probe_encoders
+from kernels import select_kernels, configure_threads
+from pipeline import new_job, run_job, discard_job, job_paths
+from recovery import recover_on_startup
+import jobqueue
+import worker
+from tiering import original_video_id, restore_original, record_access, storage_report, is_cold, hot_path_for
+from utils import safe_ext, sha256sum, guess_mime, write_json_atomic
+
+# Rotas ficam num blueprint; o app é montado por create_app() para que
+# importar este módulo não crie diretórios nem toque no banco
+bp = Blueprint('main', __name__)
+admission = AdmissionController()
 
 
 # =====================================
 # Helpers
 # =====================================
 
-def build_paths(video_id: str, ext: str, filter_name: str):
-    dt, y, m, d = now_parts()
-    base = VIDEOS / y / m / d / video_id
-    original_dir = base / 'original'
-    processed_dir = base / 'processed' / filter_name
-    thumbs_dir = base / 'thumbs'
-    original_dir.mkdir(parents=True, exist_ok=True)
-    processed_dir.mkdir(parents=True, exist_ok=True)
-    thumbs_dir.mkdir(parents=True, exist_ok=True)
-    return {
-        'base': base,
-        'original': original_dir / f'video{ext}',
-        'processed': processed_dir / f'video{ext}',
-        'thumb_jpg': thumbs_dir / 'frame_0001.jpg',
-        'preview_gif': thumbs_dir / 'preview.gif',
-        'meta_json': base / 'meta.json',
-    }
+def media_subdir(video: dict) -> str:
+    """
+    Diretório do vídeo relativo a MEDIA_ROOT (videos/Y/M/D/<id>),
+    derivado de path_processed (.../<id>/processed/<filtro>/video.ext).
+    """
+    try:
+        base = Path(video["path_processed"]).parents[2]
+        return base.relative_to(MEDIA_ROOT).as_posix()
+    except (KeyError, TypeError, ValueError, IndexError):
+        # Registro sem caminho utilizável: serve_media resolve o padrão
+        return f'videos/*/*/*/{video["id"]}'
 
 
-def public_urls(video_id: str, ext: str, filter_name: str):
+def preview_file(video: dict) -> str | None:
+    """
+    Nome do preview animado do vídeo (preview.webp, .mp4 ou .gif), gravado
+    no registro; '' (vídeo sem preview) vira None. Registros anteriores à
+    coluna são preenchidos por db.init_db.
+    """
+    return video.get("preview_file") or None
+
+
+def public_urls(video: dict):
+    """URLs públicas montadas a partir das colunas do registro"""
+    base = media_subdir(video)
+    ext = video["ext"]
+    preview = preview_file(video)
+    preview_url = url_for(
+        '.serve_media',
+        subpath=f'{base}/thumbs/{preview}',
+        _external=True
+    ) if preview else None
     return {
-        'view': url_for('view_video', video_id=video_id, _external=True),
+        'view': url_for('.view_video', video_id=video["id"], _external=True),
         'original': url_for(
-            'serve_media',
-            subpath=f'videos/*/*/*/{video_id}/original/video{ext}',
+            '.serve_media',
+            subpath=f'{base}/original/video{ext}',
             _external=True
         ),
         'processed': url_for(
-            'serve_media',
-            subpath=f'videos/*/*/*/{video_id}/processed/{filter_name}/video{ext}',
+            '.serve_media',
+            subpath=f'{base}/processed/{video["filter"]}/video{ext}',
             _external=True
         ),
         'thumb': url_for(
-            'serve_media',
-            subpath=f'videos/*/*/*/{video_id}/thumbs/frame_0001.jpg',
-            _external=True
-        ),
-        'gif': url_for(
-            'serve_media',
-            subpath=f'videos/*/*/*/{video_id}/thumbs/preview.gif',
+            '.serve_media',
+            subpath=f'{base}/thumbs/frame_0001.jpg',
             _external=True
         ),
+        # Nome legado: aponta para o mesmo preview animado, seja qual for o formato
+        'gif': preview_url,
+        'preview': preview_url,
     }
 
 
-def save_original_video_properly(uploaded_file, original_path: Path):
-    """
-    Salva o vídeo original garantindo que não seja corrompido.
-    Usa OpenCV para reescrever o vídeo com codec compatível.
-    """
-    print(f"Salvando vídeo original: {original_path}")
-    
-    # Primeiro salva temporariamente o arquivo uploadado
-    with tempfile.NamedTemporaryFile(suffix='.tmp', delete=False) as temp_file:
-        temp_path = Path(temp_file.name)
-        uploaded_file.save(temp_path)
-        uploaded_file.seek(0)  # Reset para caso seja usado novamente
-    
-    try:
-        # Abre o arquivo temporário com OpenCV
-        cap = cv2.VideoCapture(str(temp_path))
-        if not cap.isOpened():
-            print("Falha ao abrir vídeo temporário, salvando diretamente...")
-            # Fallback: salva diretamente
-            uploaded_file.save(original_path)
-            return
-        
-        # Obter propriedades
-        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-        print(f"Propriedades do original: {width}x{height}, {fps} FPS")
-        
-        # Se não conseguir obter dimensões, usa fallback
-        if width <= 0 or height <= 0:
-            ret, test_frame = cap.read()
-            if ret:
-                height, width = test_frame.shape[:2]
-                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            else:
-                print("Não foi possível ler frame, usando fallback...")
-                cap.release()
-                uploaded_file.save(original_path)
-                return
-        
-        # Garantir dimensões pares
-        width = width + (width % 2)
-        height = height + (height % 2)
-        
-        # Usar codec compatível para o original
-        fourcc = cv2.VideoWriter_fourcc(*'avc1')  # H.264
-        
-        original_path.parent.mkdir(parents=True, exist_ok=True)
-        out = cv2.VideoWriter(str(original_path), fourcc, fps, (width, height))
-        
-        # Se falhar, tenta MJPG
-        if not out.isOpened():
-            print("Falha com avc1, tentando MJPG...")
-            fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-            out = cv2.VideoWriter(str(original_path), fourcc, fps, (width, height))
-            
-            # Se ainda falhar, usa fallback
-            if not out.isOpened():
-                print("Falha com todos os codecs, usando fallback...")
-                cap.release()
-                uploaded_file.save(original_path)
-                return
-        
-        # Copia todos os frames
-        frame_count = 0
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Redimensionar se necessário
-            if frame.shape[:2] != (height, width):
-                frame = cv2.resize(frame, (width, height))
-            
-            out.write(frame)
-            frame_count += 1
-        
-        cap.release()
-        out.release()
-        
-        print(f"Vídeo original salvo com {frame_count} frames")
-        
-        # Verificar se foi criado corretamente
-        if not original_path.exists() or original_path.stat().st_size == 0:
-            print("Falha na reescrita, usando fallback...")
-            uploaded_file.save(original_path)
-    
-    except Exception as e:
-        print(f"Erro ao processar original: {e}, usando fallback...")
-        # Em caso de erro, salva diretamente
-        uploaded_file.save(original_path)
-    
-    finally:
-        # Remove arquivo temporário
-        if temp_path.exists():
-            temp_path.unlink()
+def with_urls(video: dict) -> dict:
+    video["preview_file"] = preview_file(video)
+    video["urls"] = public_urls(video)
+    return video
+
+
+def api_video(video: dict) -> dict:
+    """Registro com URLs também no nível de cima (compatível com o client Tkinter)"""
+    u = with_urls(video)["urls"]
+    video["original"]  = u["original"]
+    video["processed"] = u["processed"]
+    video["thumb"]     = u["thumb"]
+    video["view"]      = u["view"]
+    video["gif"]       = u["gif"]
+    video["preview"]   = u["preview"]
+    return video
+
+
+def parse_clip_args(form):
+    """Lê start/end (segundos) e roi ("x,y,w,h") do formulário; ValueError se inválidos"""
+    start_sec = float(form["start"]) if form.get("start") else None
+    end_sec = float(form["end"]) if form.get("end") else None
+    # float() aceita "inf" e "nan", que estouram na conversão para frames
+    for value in (start_sec, end_sec):
+        if value is not None and not math.isfinite(value):
+            raise ValueError("start/end devem ser números finitos")
+    roi = None
+    if form.get("roi"):
+        roi = tuple(int(v) for v in form["roi"].split(","))
+        if len(roi) != 4:
+            raise ValueError("roi deve ser x,y,w,h")
+    return start_sec, end_sec, roi
 
 
 def generate_thumbnail(video_path: Path, thumb_path: Path):
@@ -195,6 +141,52 @@ def save_meta_json(meta_path: Path, data: dict):
         json.dump(data, f, indent=4)
 
 
+def video_dir(video: dict) -> Path | None:
+    """
+    Diretório do vídeo no disco (videos/Y/M/D/<id>), a partir de
+    path_processed ou de path_original (na camada fria, o diretório quente
+    correspondente). None se nenhum dos dois existir.
+    """
+    candidates = []
+    if video.get("path_processed"):
+        candidates.append(Path(video["path_processed"]).parent.parent.parent)
+    if video.get("path_original"):
+        original = Path(video["path_original"])
+        if is_cold(original):
+            original = hot_path_for(original)
+        candidates.append(original.parent.parent)
+    for base in candidates:
+        if base.name == video["id"] and base.is_dir():
+            return base
+    return None
+
+
+def meta_json_outdated(meta_path: Path, meta: dict) -> bool:
+    """True se o meta.json não existir ou divergir das colunas de `meta`"""
+    try:
+        with open(meta_path) as f:
+            exported = json.load(f)
+    except (OSError, ValueError):
+        return True
+    return any(exported.get(col) != meta.get(col) for col in VIDEO_COLUMNS)
+
+
+def export_meta_json(video: dict) -> Path | None:
+    """
+    Grava o meta.json do vídeo a partir do banco (de novo se o registro
+    mudou, ex.: original movido de camada). Serve de exportação e de
+    insumo para rebuild_db.py. None se o diretório do vídeo não existir.
+    """
+    base = video_dir(video)
+    if base is None:
+        return None
+    meta_path = base / 'meta.json'
+    meta = with_urls(dict(video))
+    if meta_json_outdated(meta_path, meta):
+        write_json_atomic(meta_path, meta)
+    return meta_path
+
+
 def move_video_to_trash(video_id):
     """
     Move o vídeo para a pasta trash baseado no video_id.
@@ -205,19 +197,14 @@ def move_video_to_trash(video_id):
         print("Vídeo não encontrado no banco de dados.")
         return False
 
-    # Procura pelo diretório do vídeo na estrutura videos/Y/M/D/video_id
-    video_base_path = None
+    # Diretório pelos caminhos do registro (ver video_dir); na camada fria
+    # só o original fica lá, o resto segue em VIDEOS
+    video_base_path = video_dir(video)
+    cold_original = None
+    if video.get("path_original") and is_cold(Path(video["path_original"])):
+        cold_original = Path(video["path_original"])
     
-    # Primeiro tenta usar o path_original se estiver disponível
-    if "path_original" in video:
-        original_path = Path(video["path_original"])
-        # O path original é: videos/Y/M/D/video_id/original/video.ext
-        # Então o base_path é 2 níveis acima
-        potential_base = original_path.parent.parent
-        if potential_base.name == video_id and potential_base.exists():
-            video_base_path = potential_base
-    
-    # Se não encontrou pelo path_original, procura manualmente
+    # Se os caminhos do registro não levam ao diretório, procura manualmente
     if video_base_path is None:
         print(f"Procurando diretório para video_id: {video_id}")
         # Procura em todos os subdiretórios de videos/
@@ -230,9 +217,9 @@ def move_video_to_trash(video_id):
                 for day_dir in month_dir.iterdir():
                     if not day_dir.is_dir():
                         continue
-                    video_dir = day_dir / video_id
-                    if video_dir.exists() and video_dir.is_dir():
-                        video_base_path = video_dir
+                    candidate = day_dir / video_id
+                    if candidate.is_dir():
+                        video_base_path = candidate
                         break
                 if video_base_path:
                     break
@@ -251,7 +238,6 @@ def move_video_to_trash(video_id):
         
         # Se já existe na trash, remove primeiro
         if trash_path.exists():
-            import shutil
             shutil.rmtree(trash_path)
         
         # Garante que o diretório pai da trash existe
@@ -259,6 +245,9 @@ def move_video_to_trash(video_id):
         
         # Move o diretório inteiro
         video_base_path.rename(trash_path)
+        if cold_original is not None and cold_original.exists():
+            (trash_path / 'original').mkdir(exist_ok=True)
+            shutil.move(str(cold_original), str(trash_path / 'original' / cold_original.name))
         print(f"Vídeo movido para trash: {trash_path}")
         return True
         
@@ -270,7 +259,7 @@ def move_video_to_trash(video_id):
 # Routes
 # =====================================
 
-@app.route("/upload", methods=["POST"])
+@bp.route("/upload", methods=["POST"])
 def upload_video():
     file = request.files.get("video")
     filter_name = request.form.get("filter", "gray")
@@ -278,78 +267,214 @@ def upload_video():
     if not file:
         return jsonify({"error": "Nenhum arquivo enviado"}), 400
 
+    try:
+        skip_threshold = float(request.form.get("skip_threshold", SKIP_DIFF_THRESHOLD))
+        if not (math.isfinite(skip_threshold) and skip_threshold >= 0):
+            raise ValueError(skip_threshold)
+    except ValueError:
+        return jsonify({"error": "skip_threshold inválido"}), 400
+
+    try:
+        start_sec, end_sec, roi = parse_clip_args(request.form)
+    except ValueError as e:
+        return jsonify({"error": f"Parâmetros de trecho/região inválidos: {e}"}), 400
+
     ext = safe_ext(file.filename)
     if not ext:
         return jsonify({"error": "Extensão não suportada"}), 400
 
     video_id = str(uuid.uuid4().hex)
-    paths = build_paths(video_id, ext, filter_name)
-
-    print(f"Iniciando upload do vídeo {video_id} com filtro {filter_name}")
 
+    # Repetições com a mesma chave devolvem o vídeo já processado
+    idempotency_key = request.headers.get("Idempotency-Key") or request.form.get("idempotency_key")
+    if idempotency_key:
+        owner_id = claim_idempotency_key(idempotency_key, video_id)
+        if owner_id is not None:
+            video = get_video(owner_id)
+            if video:
+                return jsonify(with_urls(video)), 200
+            return jsonify({"error": "Upload com esta chave ainda em processamento", "id": owner_id}), 409
+
+    # Grava o upload em incoming/ e estima o custo antes de qualquer trabalho pesado
+    incoming_path = INCOMING / f"{video_id}{ext}"
+    file.save(incoming_path)
+
+    completed = False
+    queued = False
     try:
-        # Salva o original de forma segura
-        save_original_video_properly(file, paths["original"])
-        
-        # Verifica se o original foi salvo
-        if not paths["original"].exists():
-            return jsonify({"error": "Falha ao salvar vídeo original"}), 500
-        
-        print(f"Original salvo: {paths['original']} ({paths['original'].stat().st_size} bytes)")
-
-        # Processa vídeo (aplicando filtro)
-        processing_result = process_video(
-            paths["original"],
-            paths["processed"],
-            filter_name,
-            paths["thumb_jpg"],
-            paths["preview_gif"]
-        )
-        
-        print(f"Vídeo processado: {paths['processed']} ({paths['processed'].stat().st_size} bytes)")
-
-        # Metadados
-        meta = {
-            "id": video_id,
-            "original_name": file.filename,
-            "ext": ext,
-            "filter": filter_name,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "path_original": str(paths["original"]),
-            "path_processed": str(paths["processed"]),
-            "urls": public_urls(video_id, ext, filter_name),
-            **processing_result  # Adiciona fps, width, height, etc.
-        }
+        try:
+            info = probe_video(incoming_path)
+        except RuntimeError as e:
+            return jsonify({"error": f"Vídeo inválido: {e}"}), 400
+
+        # Valida trecho e região já com as dimensões reais; o custo estimado
+        # considera só os frames do trecho
+        try:
+            start_frame, end_frame, _ = clip_bounds(info, start_sec, end_sec, roi)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if end_frame is not None or start_frame:
+            info = dict(info, frame_count=(end_frame or info["frame_count"]) - start_frame)
+
+        if PROCESSING_MODE == 'queue':
+            # Só ingere: o arquivo fica em incoming/ até um worker pegar o job
+            response = enqueue_upload(video_id, file.filename, ext, filter_name, incoming_path,
+                                      skip_threshold, idempotency_key, start_sec, end_sec, roi)
+            completed = queued = response[1] == 202
+            return response
+
+        try:
+            ticket = admission.acquire(video_id, estimate_cost(info))
+        except AdmissionRejected as e:
+            print(f"Upload {video_id} recusado: {e.reason}")
+            resp = jsonify({"error": e.reason, "retry_after": e.retry_after})
+            resp.headers["Retry-After"] = str(e.retry_after)
+            return resp, 429
+
+        try:
+            job = new_job(video_id, file.filename, ext, filter_name, incoming_path,
+                          skip_threshold, idempotency_key, start_sec, end_sec, roi)
+            response = process_upload(job)
+            completed = response[1] == 200
+            return response
+        finally:
+            admission.release(ticket)
+    finally:
+        if not queued:
+            incoming_path.unlink(missing_ok=True)
+        if idempotency_key and not completed:
+            release_idempotency_key(idempotency_key)
+
+
+def process_upload(job: dict):
+    print(f"Iniciando upload do vídeo {job['id']} com filtro {job['filter']}")
 
-        save_meta_json(paths["meta_json"], meta)
-        insert_video(meta)
+    try:
+        meta = run_job(job)
+        with_urls(meta)
+        if WRITE_META_JSON:
+            paths = job_paths(Path(job["base"]), job["ext"], job["filter"])
+            save_meta_json(paths["meta_json"], meta)
 
-        print(f"Upload concluído com sucesso: {video_id}")
+        print(f"Upload concluído com sucesso: {job['id']}")
         return jsonify(meta), 200
     
     except Exception as e:
         print(f"Erro durante upload: {e}")
+        # Não deixa diretório pela metade para trás
+        discard_job(Path(job["base"]), job)
         return jsonify({"error": f"Erro ao processar vídeo: {str(e)}"}), 500
 
 
-@app.route("/videos", methods=["GET"])
+def enqueue_upload(video_id: str, original_name: str, ext: str, filter_name: str, incoming_path: Path,
+                   skip_threshold: float, idempotency_key: str | None, start_sec, end_sec, roi):
+    try:
+        jobqueue.check_capacity()
+    except jobqueue.QueueFull as e:
+        print(f"Upload {video_id} recusado: {e.reason}")
+        resp = jsonify({"error": e.reason, "retry_after": e.retry_after})
+        resp.headers["Retry-After"] = str(e.retry_after)
+        return resp, 429
+
+    job = new_job(video_id, original_name, ext, filter_name, incoming_path,
+                  skip_threshold, idempotency_key, start_sec, end_sec, roi)
+    try:
+        jobqueue.enqueue(job)
+    except Exception as e:
+        print(f"Erro ao enfileirar {video_id}: {e}")
+        discard_job(Path(job["base"]), job)
+        return jsonify({"error": f"Erro ao enfileirar vídeo: {str(e)}"}), 500
+
+    print(f"Upload {video_id} enfileirado com filtro {filter_name}")
+    status_url = url_for('.job_status', job_id=video_id, _external=True)
+    resp = jsonify({"id": video_id, "state": "queued", "status_url": status_url})
+    resp.headers["Location"] = status_url
+    return resp, 202
+
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Estado de um upload do modo fila; com o vídeo pronto, inclui o registro"""
+    status = jobqueue.status(job_id)
+    video = get_video(job_id)
+    if status is None and video is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+
+    if status is None:
+        # Processado no modo inline (ou antes da fila existir)
+        status = {"id": job_id, "state": "done"}
+    # O caminho no disco compartilhado não é público
+    status.pop("base", None)
+    if video is not None and status["state"] == "done":
+        status["video"] = api_video(video)
+    return jsonify(status), 200
+
+
+@bp.route("/admin/queue", methods=["GET"])
+def queue_status():
+    return jsonify(jobqueue.stats())
+
+
+@bp.route("/admin/admission", methods=["GET"])
+def admission_status():
+    return jsonify(admission.snapshot())
+
+
+@bp.route("/admin/codecs", methods=["GET"])
+def codecs_status():
+    return jsonify(probe_encoders())
+
+
+@bp.route("/admin/kernels", methods=["GET"])
+def kernels_status():
+    return jsonify(select_kernels())
+
+
+@bp.route("/admin/storage", methods=["GET"])
+def storage_status():
+    return jsonify(storage_report()), 200
+
+
+@bp.route("/videos", methods=["GET"])
 def api_list_videos():
     videos = list_videos()
     # garante compatibilidade com o client Tkinter
-    for v in videos:
-        u = v.get("urls") or {}
-        v["original"]  = u.get("original", "")
-        v["processed"] = u.get("processed", "")
-        v["thumb"]     = u.get("thumb", "")
-        v["view"]      = u.get("view", "")
-        v["gif"]       = u.get("gif", "")
-    return jsonify(videos)
-
-@app.route("/video/<video_id>", methods=["GET"])
+    return jsonify([api_video(v) for v in videos])
+
+
+@bp.route("/videos/search", methods=["GET"])
+def api_search_videos():
+    """
+    Busca no catálogo. Parâmetros (todos opcionais):
+    q (nome), filter, min_width, max_width, min_height, max_height,
+    min_fps, max_fps, from/to (datas ISO de criação), limit, offset.
+    """
+    args = request.args
+    try:
+        filters = {
+            "filter": args.get("filter") or None,
+            "created_from": args.get("from") or None,
+            "created_to": args.get("to") or None,
+        }
+        for name in ("min_width", "max_width", "min_height", "max_height"):
+            filters[name] = int(args[name]) if args.get(name) else None
+        for name in ("min_fps", "max_fps"):
+            filters[name] = float(args[name]) if args.get(name) else None
+        # limit negativo no SQLite é "sem limite": força 1..500
+        limit = max(1, min(int(args.get("limit", 50)), 500))
+        offset = max(0, int(args.get("offset", 0)))
+    except ValueError:
+        return jsonify({"error": "Parâmetros de busca inválidos"}), 400
+
+    videos = search_videos(args.get("q"), limit=limit, offset=offset, **filters)
+    return jsonify([api_video(v) for v in videos])
+
+@bp.route("/video/<video_id>", methods=["GET"])
 def view_video(video_id):
     video = get_video(video_id)
     if not video:
         abort(404)
+    with_urls(video)
 
     html = """
     <html>
@@ -361,13 +486,23 @@ def view_video(video_id):
         </video>
         <p>Filtro: {{v['filter']}}</p>
         <p>Criado em: {{v['created_at']}}</p>
-        <p><a href="{{url_for('gallery')}}">← Voltar para galeria</a></p>
+        <p><a href="{{url_for('.gallery')}}">← Voltar para galeria</a></p>
     </body>
     </html>
     """
     return render_template_string(html, v=video)
 
-@app.route("/delete_video/<video_id>", methods=["POST"])
+@bp.route("/video/<video_id>/meta.json", methods=["GET"])
+def video_meta(video_id):
+    video = get_video(video_id)
+    if not video:
+        abort(404)
+    meta_path = export_meta_json(video)
+    if meta_path is None:
+        abort(404)
+    return send_from_directory(meta_path.parent, meta_path.name)
+
+@bp.route("/delete_video/<video_id>", methods=["POST"])
 def delete_video(video_id):
     try:
         print(f"Tentando deletar vídeo: {video_id}")
@@ -393,9 +528,9 @@ def delete_video(video_id):
     except Exception as e:
         print(f"Erro inesperado ao deletar vídeo {video_id}: {e}")
         return jsonify({"success": False, "error": f"Erro interno: {str(e)}"}), 500
-@app.route("/gallery", methods=["GET"])
+@bp.route("/gallery", methods=["GET"])
 def gallery():
-    videos = list_videos()
+    videos = [with_urls(v) for v in list_videos()]
     html = """
     <html>
     <head>
@@ -431,30 +566,76 @@ def gallery():
     """
     return render_template_string(html, videos=videos)
     
-@app.route("/", methods=["GET"])
+@bp.route("/", methods=["GET"])
 def index():
-    videos = list_videos()
+    videos = [with_urls(v) for v in list_videos()]
     return render_template('index.html', videos=videos)
 
-@app.route("/media/<path:subpath>")
+@bp.route("/media/<path:subpath>")
 def serve_media(subpath):
     # Resolve padrões com * nos caminhos gerados por public_urls(...)
     if "*" in subpath:
         matches = list((MEDIA_ROOT).glob(subpath))
-        if not matches:
-            abort(404)
-        full_path = matches[0]
+        full_path = matches[0] if matches else None
     else:
         full_path = MEDIA_ROOT / subpath
 
-    if not full_path.exists():
+    # Originais podem estar na camada fria (ver tiering.py): restaura no
+    # acesso e conta uma visualização por requisição que começa do byte 0
+    video_id = original_video_id(subpath)
+    if video_id is not None:
+        if full_path is None or not full_path.exists():
+            full_path = restore_original(video_id)
+        if request.headers.get('Range', 'bytes=0-').startswith('bytes=0-'):
+            record_access(video_id)
+
+    if full_path is None or not full_path.exists():
         abort(404)
     return send_from_directory(full_path.parent, full_path.name)
 
 
 # =====================================
-# Entrypoint
+# App factory / Entrypoint
 # =====================================
 
+def init_storage():
+    """
+    Cria a árvore de mídia e o schema do banco, testa os codecs e os
+    kernels de filtro do host e retoma jobs interrompidos
+    """
+    for p in (MEDIA_ROOT, INCOMING, TRASH, VIDEOS):
+        p.mkdir(parents=True, exist_ok=True)
+    init_db()
+    probe_encoders()
+    # Os jobs simultâneos de todos os workers do gunicorn dividem os núcleos
+    # em vez de cada um usar todos
+    configure_threads(admission.max_jobs * server_processes())
+    select_kernels()
+    recover_on_startup()
+
+
+def start_recovered_jobs():
+    """
+    Modo inline: retoma os jobs que a recuperação pôs na fila numa thread
+    deste processo, sob a admissão dele. Com o gunicorn roda em cada worker
+    (serve.py, post_worker_init), nunca no master.
+    """
+    if PROCESSING_MODE == 'queue':
+        # Os jobs são dos worker.py
+        return
+    threading.Thread(target=worker.resume_recovered, args=(admission,), daemon=True).start()
+
+
+def create_app(init: bool = True) -> Flask:
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    if init:
+        init_storage()
+    return app
+
+
 if __name__ == "__main__":
+    # Servidor de desenvolvimento; em produção use serve.py
+    app = create_app()
+    start_recovered_jobs()
     app.run(host=HOST, port=PORT, debug=DEBUG)
\ No newline at end of file
@@ -0,0 +1,836 @@
+"""
+Benchmarks do servidor.
+
+Uso:
+    python bench.py pool --width 1920 --height 1080 --frames 120
+    python bench.py http --rows 100 --duration 10 --concurrency 8
+    python bench.py search --rows 1000000
+    python bench.py pipeline --workers 1 2 4
+    python bench.py tiering --videos 10 --recompress
+    python bench.py previews --gallery 100
+    python bench.py kernels --sizes 854x480 1280x720 1920x1080 --threads 1 4
+    python bench.py queue --jobs 8 --workers 1 2 4
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+import random
+import shutil
+import http.client
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+# =====================================
+# Helpers
+# =====================================
+
+def make_synthetic_video(path: Path, width: int, height: int, frames: int, fps: float = 30.0):
+    """Gera um vídeo com gradiente e um objeto em movimento"""
+    out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    if not out.isOpened():
+        raise RuntimeError("Não foi possível criar o vídeo sintético")
+    base = np.zeros((height, width, 3), np.uint8)
+    base[:] = np.linspace(0, 255, width, dtype=np.uint8)[None, :, None]
+    radius = max(min(width, height) // 10, 4)
+    for i in range(frames):
+        frame = base.copy()
+        x = (i * 8) % width
+        cv2.circle(frame, (x, height // 2), radius, (0, 200, 255), -1)
+        out.write(frame)
+    out.release()
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def print_table(rows: list[dict]):
+    if not rows:
+        return
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+# =====================================
+# Pool de buffers (processing.process_video)
+# =====================================
+
+def run_pool_once(src: Path, filter_name: str, reuse: bool) -> dict:
+    from buffers import FramePool
+    from processing import process_video
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        pool = FramePool(reuse=reuse)
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        result = process_video(src, tmp / 'out.avi', filter_name, tmp / 'thumb.jpg', None, pool=pool)
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    stats = pool.stats()
+    # ru_maxrss é em KiB no Linux
+    return {
+        'mode': 'pool' if reuse else 'sem pool',
+        'fps': round(result['processed_frames'] / elapsed, 1),
+        'allocs': stats['allocations'],
+        'alloc_MB': round(stats['allocated_bytes'] / 2**20, 1),
+        'alloc_per_frame': round(stats['allocations'] / max(result['processed_frames'], 1), 2),
+        'traced_peak_MB': round(peak / 2**20, 1),
+        'peak_rss_MB': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def bench_pool(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / 'src.avi'
+        make_synthetic_video(src, args.width, args.height, args.frames)
+
+        rows = []
+        # Cada modo roda num processo separado para o pico de RSS ser independente
+        for reuse in (False, True):
+            proc = subprocess.run(
+                [sys.executable, __file__, '_pool-run', str(src), args.filter, str(int(reuse))],
+                capture_output=True, text=True, check=True,
+            )
+            rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"\n{args.width}x{args.height}, {args.frames} frames, filtro {args.filter}")
+    print_table(rows)
+
+
+# =====================================
+# Pipeline multiprocesso (FrameRing) x laço em thread
+# =====================================
+
+def _handoff_echo(tasks, done):
+    while (item := tasks.get()) is not None:
+        done.put(item if isinstance(item, int) else len(item))
+
+
+def bench_handoff(shape: tuple, frames: int) -> list[dict]:
+    """Custo de passar frames a outro processo: pickle pela fila x índice de slot"""
+    import multiprocessing
+    from frame_ring import FrameRing
+
+    ctx = multiprocessing.get_context('spawn')
+    rows = []
+    for mode in ('pickle', 'shared_memory'):
+        tasks, done = ctx.Queue(), ctx.Queue()
+        proc = ctx.Process(target=_handoff_echo, args=(tasks, done))
+        proc.start()
+        ring = FrameRing(shape, 4) if mode == 'shared_memory' else None
+        frame = np.full(shape, 127, np.uint8)
+        t0 = time.perf_counter()
+        for i in range(frames):
+            if ring is None:
+                tasks.put(frame)
+            else:
+                np.copyto(ring.view(i % ring.slots), frame)
+                tasks.put(i % ring.slots)
+            done.get()
+        elapsed = time.perf_counter() - t0
+        tasks.put(None)
+        proc.join()
+        if ring is not None:
+            ring.close()
+        rows.append({
+            'handoff': mode,
+            'ms_por_frame': round(elapsed / frames * 1000, 3),
+            'frames_s': round(frames / elapsed, 1),
+        })
+    return rows
+
+
+def bench_pipeline(args):
+    from processing import process_video
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        src = tmp / 'src.avi'
+        make_synthetic_video(src, args.width, args.height, args.frames)
+
+        rows = []
+        for workers in [0] + args.workers:
+            t0 = time.perf_counter()
+            result = process_video(src, tmp / f'out_{workers}.avi', args.filter, tmp / 'thumb.jpg', None,
+                                   workers=workers)
+            elapsed = time.perf_counter() - t0
+            rows.append({
+                'modo': 'thread' if workers == 0 else f'{workers} processos',
+                'frames': result['processed_frames'],
+                'seg': round(elapsed, 2),
+                'fps': round(result['processed_frames'] / elapsed, 1),
+            })
+
+        handoff = bench_handoff((args.height, args.width, 3), min(args.frames, 200))
+
+    print(f"\n{args.width}x{args.height}, {args.frames} frames, filtro {args.filter}, "
+          f"{os.cpu_count()} CPUs")
+    print_table(rows)
+    print()
+    print_table(handoff)
+
+
+# =====================================
+# Servidor HTTP: dev (app.py) x produção (serve.py)
+# =====================================
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Servidor não respondeu na porta {port}")
+
+
+def seed_catalog(media_root: Path, rows: int, media_bytes: int) -> str:
+    """Popula o banco (DB_PATH do ambiente) e cria um arquivo de mídia; retorna seu subpath"""
+    from db import init_db, insert_videos
+
+    init_db()
+    base = media_root / 'videos' / '2025' / '01' / '01'
+    media_path = base / 'seed' / 'processed' / 'gray' / 'video.mp4'
+    media_path.parent.mkdir(parents=True, exist_ok=True)
+    media_path.write_bytes(os.urandom(media_bytes))
+
+    insert_videos({
+        'id': f'{i:032x}',
+        'original_name': f'video_{i}.mp4',
+        'ext': '.mp4',
+        'filter': 'gray',
+        'fps': 30.0,
+        'width': 1280,
+        'height': 720,
+        'created_at': f'2025-01-01T00:00:{i % 60:02d}+00:00',
+        'path_original': str(base / f'{i:032x}' / 'original' / 'video.mp4'),
+        'path_processed': str(base / f'{i:032x}' / 'processed' / 'gray' / 'video.mp4'),
+    } for i in range(rows))
+    return media_path.relative_to(media_root).as_posix()
+
+
+def hammer(port: int, path: str, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        nonlocal errors
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local, local_errors = [], 0
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                continue
+            local.append(time.perf_counter() - t0)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    return {
+        'req_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'errors': errors,
+    }
+
+
+def bench_http(args):
+    here = Path(__file__).parent
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        env = dict(os.environ, MEDIA_ROOT=str(tmp / 'media'), DB_PATH=str(tmp / 'videos.db'), DEBUG='0')
+        os.environ.update(MEDIA_ROOT=env['MEDIA_ROOT'], DB_PATH=env['DB_PATH'])
+        media_subpath = seed_catalog(Path(env['MEDIA_ROOT']), args.rows, args.media_kb * 1024)
+
+        servers = {
+            'dev (app.py)': [sys.executable, 'app.py'],
+            'produção (serve.py)': [sys.executable, 'serve.py'],
+        }
+        rows = []
+        for name, cmd in servers.items():
+            port = free_port()
+            proc = subprocess.Popen(
+                cmd, cwd=here, env=dict(env, PORT=str(port), HOST='127.0.0.1'),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_for_port(port)
+                for path in ('/videos', f'/media/{media_subpath}'):
+                    result = hammer(port, path, args.concurrency, args.duration)
+                    rows.append({'servidor': name, 'rota': path.split('/')[1], **result})
+            finally:
+                proc.terminate()
+                proc.wait(timeout=60)
+
+    print(f"\n{args.rows} registros, mídia de {args.media_kb} KiB, "
+          f"{args.concurrency} clientes, {args.duration}s por rota")
+    print_table(rows)
+
+
+# =====================================
+# Busca no catálogo (db.search_videos)
+# =====================================
+
+SEARCH_WORDS = (
+    'ferias praia aniversario festa reuniao aula palestra jogo futebol show '
+    'casamento viagem tutorial gravacao tela camera portaria garagem drone '
+    'entrevista treino corrida natal ano novo familia escola projeto demo'
+).split()
+
+
+def synthetic_rows(rows: int, seed: int = 42):
+    rng = random.Random(seed)
+    filters = ('gray', 'pixelate', 'edges')
+    sizes = ((640, 360), (1280, 720), (1920, 1080), (3840, 2160))
+    for i in range(rows):
+        width, height = rng.choice(sizes)
+        day = rng.randrange(0, 3 * 365)
+        name = '_'.join(rng.sample(SEARCH_WORDS, 3)) + f'_{rng.randrange(10000)}.mp4'
+        yield {
+            'id': f'{i:032x}',
+            'original_name': name,
+            'ext': '.mp4',
+            'filter': rng.choice(filters),
+            'fps': rng.choice((24.0, 25.0, 30.0, 60.0)),
+            'width': width,
+            'height': height,
+            'created_at': f'{2023 + day // 365}-{(day % 365) // 31 + 1:02d}-{day % 28 + 1:02d}T12:00:00+00:00',
+            'path_original': f'/media/videos/{i}/original/video.mp4',
+            'path_processed': f'/media/videos/{i}/processed/gray/video.mp4',
+        }
+
+
+def time_query(fn, repeat: int = 5) -> tuple[float, int]:
+    best, count = float('inf'), 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        count = len(fn())
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000, count
+
+
+def bench_search(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_PATH'] = str(Path(tmp) / 'videos.db')
+        from db import init_db, insert_videos, search_videos, get_conn
+
+        init_db()
+        t0 = time.perf_counter()
+        insert_videos(synthetic_rows(args.rows))
+        insert_sec = time.perf_counter() - t0
+        print(f"{args.rows} linhas inseridas em {insert_sec:.1f}s "
+              f"({args.rows / insert_sec:.0f} linhas/s, com FTS e índices)")
+
+        def scan(where: str, params: tuple):
+            # Mesma consulta sem FTS nem índices (varredura da tabela)
+            sql = (f'SELECT id FROM videos NOT INDEXED WHERE {where} '
+                   f'ORDER BY created_at DESC LIMIT 50')
+            with get_conn() as conn:
+                return conn.execute(sql, params).fetchall()
+
+        cases = [
+            ('nome: praia', lambda: search_videos('praia'),
+             lambda: scan("original_name LIKE ?", ('%praia%',))),
+            ('nome: drone garagem', lambda: search_videos('drone garagem'),
+             lambda: scan("original_name LIKE ? AND original_name LIKE ?", ('%drone%', '%garagem%'))),
+            ('filtro + período', lambda: search_videos(filter='edges', created_from='2024-03', created_to='2024-04'),
+             lambda: scan("filter = ? AND created_at >= ? AND created_at < ?", ('edges', '2024-03', '2024-04'))),
+            ('resolução 4K', lambda: search_videos(min_width=3840, min_height=2160),
+             lambda: scan("width >= ? AND height >= ?", (3840, 2160))),
+            ('fps >= 60 + nome', lambda: search_videos('casamento', min_fps=60),
+             lambda: scan("original_name LIKE ? AND fps >= ?", ('%casamento%', 60))),
+        ]
+
+        rows = []
+        for name, indexed, scanned in cases:
+            ms_idx, n = time_query(indexed)
+            ms_scan, _ = time_query(scanned, repeat=2)
+            rows.append({
+                'consulta': name,
+                'resultados': n,
+                'indexado_ms': round(ms_idx, 2),
+                'varredura_ms': round(ms_scan, 1),
+                'ganho': f'{ms_scan / ms_idx:.0f}x' if ms_idx else '-',
+            })
+        print_table(rows)
+
+
+# =====================================
+# Camada fria dos originais (tiering.py)
+# =====================================
+
+def bench_tiering(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        os.environ.update(MEDIA_ROOT=str(tmp / 'media'), DB_PATH=str(tmp / 'videos.db'))
+        from config import MEDIA_ROOT
+        from db import insert_videos
+        from pipeline import save_original_video_properly
+        from app import create_app
+        import tiering
+
+        app = create_app()
+        src = tmp / 'src.avi'
+        make_synthetic_video(src, args.width, args.height, args.frames)
+
+        metas = []
+        for i in range(args.videos):
+            base = MEDIA_ROOT / 'videos' / '2025' / '01' / '01' / f'{i:032x}'
+            original = base / 'original' / 'video.avi'
+            processed = base / 'processed' / 'gray' / 'video.avi'
+            original.parent.mkdir(parents=True)
+            processed.parent.mkdir(parents=True)
+            save_original_video_properly(src, original)
+            shutil.copyfile(original, processed)
+            metas.append({
+                'id': base.name, 'ext': '.avi', 'filter': 'gray',
+                'created_at': '2025-01-01T00:00:00+00:00',
+                'path_original': str(original), 'path_processed': str(processed),
+            })
+        insert_videos(metas)
+
+        t0 = time.perf_counter()
+        result = tiering.apply_policy(recompress_original=args.recompress)
+        policy_sec = time.perf_counter() - t0
+
+        client = app.test_client()
+
+        def get_ms(subpath: str) -> float:
+            t = time.perf_counter()
+            resp = client.get(f'/media/{subpath}')
+            resp.get_data()
+            assert resp.status_code == 200, resp.status_code
+            return (time.perf_counter() - t) * 1000
+
+        hot, restore, after = [], [], []
+        for meta in metas:
+            rel = Path(meta['path_original']).relative_to(MEDIA_ROOT).as_posix()
+            hot.append(get_ms(Path(meta['path_processed']).relative_to(MEDIA_ROOT).as_posix()))
+            restore.append(get_ms(rel))
+            after.append(get_ms(rel))
+
+    print(f"\n{args.videos} originais {args.width}x{args.height} x {args.frames} frames, "
+          f"recompressão {'ligada' if args.recompress else 'desligada'}")
+    print(f"Política: {result['moved']} movidos em {policy_sec:.2f}s, "
+          f"{result['hot_bytes_freed'] / 2**20:.1f} MiB liberados no disco quente, "
+          f"recompressão economizou {result['recompression_saved_bytes'] / 2**20:.1f} MiB")
+    print_table([
+        {'acesso': name, 'p50_ms': round(percentile(v, 50), 2), 'p95_ms': round(percentile(v, 95), 2)}
+        for name, v in (('quente', hot), ('frio (restaura)', restore), ('após restaurar', after))
+    ])
+
+
+# =====================================
+# Previews animados (previews.py) x GIF legado
+# =====================================
+
+def make_scene_video(path: Path, width: int, height: int, frames: int, scenes: int = 4, fps: float = 30.0):
+    """Vídeo com `scenes` cortes: textura diferente por cena e um objeto em movimento"""
+    out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    if not out.isOpened():
+        raise RuntimeError("Não foi possível criar o vídeo sintético")
+    rng = np.random.default_rng(7)
+    per_scene = max(frames // scenes, 1)
+    radius = max(min(width, height) // 10, 4)
+    base = None
+    for i in range(frames):
+        if i % per_scene == 0:
+            small = rng.integers(0, 256, (height // 80, width // 80, 3), dtype=np.uint8)
+            base = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+        frame = base.copy()
+        cv2.circle(frame, ((i * 8) % width, height // 2), radius, (0, 200, 255), -1)
+        out.write(frame)
+    out.release()
+
+
+def legacy_gif(src: Path, dst: Path) -> dict:
+    """Preview como era antes: 1 frame a cada fps//2, até 60, em resolução cheia"""
+    from PIL import Image
+
+    t0 = time.perf_counter()
+    cap = cv2.VideoCapture(str(src))
+    sample_every = max(int(cap.get(cv2.CAP_PROP_FPS) // 2), 1)
+    frames, index = [], 0
+    while len(frames) < 60:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % sample_every == 0:
+            frames.append(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+        index += 1
+    cap.release()
+    t1 = time.perf_counter()
+    frames[0].save(dst, format='GIF', save_all=True, append_images=frames[1:], duration=500, loop=0)
+    return {'frames': len(frames), 'bytes': dst.stat().st_size, 'sec': time.perf_counter() - t0,
+            'encode_sec': time.perf_counter() - t1}
+
+
+def new_preview(src: Path, dst: Path) -> dict:
+    from previews import PreviewCollector, write_preview
+
+    t0 = time.perf_counter()
+    cap = cv2.VideoCapture(str(src))
+    collector = PreviewCollector(cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    index, frame = 0, None
+    while True:
+        ret, frame = cap.read(frame)
+        if not ret:
+            break
+        collector.add(frame, index)
+        index += 1
+    cap.release()
+    stats = write_preview(collector.frames, dst)
+    return {'frames': stats['frames'], 'bytes': stats['bytes'], 'sec': time.perf_counter() - t0,
+            'encode_sec': stats['sec']}
+
+
+def bench_previews(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        src = tmp / 'src.avi'
+        make_scene_video(src, args.width, args.height, args.frames, args.scenes)
+
+        # Thumbnail do primeiro frame, igual ao gerado no processamento
+        cap = cv2.VideoCapture(str(src))
+        _, first = cap.read()
+        cap.release()
+        cv2.imwrite(str(tmp / 'thumb.jpg'), first)
+        thumb_bytes = (tmp / 'thumb.jpg').stat().st_size
+
+        runs = {'gif legado': lambda: legacy_gif(src, tmp / 'legacy.gif')}
+        for fmt in ('webp', 'mp4', 'gif'):
+            runs[fmt] = lambda fmt=fmt: new_preview(src, tmp / f'preview.{fmt}')
+
+        rows = []
+        for name, run in runs.items():
+            result = run()
+            rows.append({
+                'preview': name,
+                'frames': result['frames'],
+                'KiB': round(result['bytes'] / 1024, 1),
+                'total_ms': round(result['sec'] * 1000, 1),
+                'codificação_ms': round(result['encode_sec'] * 1000, 1),
+                # Página com N cards: thumbs sempre, previews se todos forem vistos
+                'galeria_thumbs_MiB': round(args.gallery * thumb_bytes / 2**20, 2),
+                'galeria_c_previews_MiB': round(args.gallery * (thumb_bytes + result['bytes']) / 2**20, 2),
+            })
+
+    print(f"\n{args.width}x{args.height}, {args.frames} frames, {args.scenes} cenas, "
+          f"galeria de {args.gallery} vídeos")
+    print_table(rows)
+
+
+# =====================================
+# Kernels dos filtros x funções de processing.py
+# =====================================
+
+def time_ms(fn, repeat: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def encode_ms(frames: list[np.ndarray], is_color: bool) -> float:
+    """ms por frame para gravar os frames com o codec da sonda"""
+    from encoders import open_writer
+
+    height, width = frames[0].shape[:2]
+    with tempfile.TemporaryDirectory() as tmp:
+        out, _ = open_writer(Path(tmp) / 'out.avi', 30.0, (width, height), is_color)
+        t0 = time.perf_counter()
+        for frame in frames:
+            out.write(frame)
+        out.release()
+        return (time.perf_counter() - t0) / len(frames) * 1000
+
+
+def bench_kernels(args):
+    from buffers import FramePool
+    from processing import FILTERS
+    from kernels import KERNELS, select_kernels, configure_threads
+
+    selected = select_kernels()['selected']
+    rows, encode_rows, thread_rows = [], [], []
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        width, height = map(int, size.split('x'))
+        # Ruído + formas: Canny e a média por bloco trabalham de verdade
+        frame = rng.integers(0, 256, (height, width, 3), np.uint8)
+        cv2.rectangle(frame, (width // 4, height // 4), (width // 2, height // 2), (40, 180, 220), -1)
+
+        for filter_name, modes in KERNELS.items():
+            pool = FramePool()
+            reference = FILTERS[filter_name](frame, pool=pool).copy()
+            base_ms = time_ms(lambda: FILTERS[filter_name](frame, pool=pool), args.repeat)
+            rows.append({'resolução': size, 'filtro': filter_name, 'kernel': 'processing.py',
+                         'ms': round(base_ms, 2), 'speedup': 1.0, 'max_dif': 0, 'escolhido': ''})
+            for mode, candidates in modes.items():
+                for name, kernel in candidates.items():
+                    pool = FramePool()
+                    output = kernel(frame, pool=pool)
+                    compare = reference[..., 0] if output.ndim == 2 else reference
+                    ms = time_ms(lambda: kernel(frame, pool=pool), args.repeat)
+                    rows.append({
+                        'resolução': size, 'filtro': filter_name, 'kernel': f'{mode}/{name}',
+                        'ms': round(ms, 2), 'speedup': round(base_ms / ms, 2),
+                        'max_dif': int(cv2.norm(output, compare, cv2.NORM_INF)),
+                        'escolhido': '*' if selected[f'{filter_name}/{mode}'] == name else '',
+                    })
+
+        # A saída em 1 canal também economiza na conversão dentro do encoder
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        frames = args.encode_frames
+        bgr_ms = encode_ms([cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)] * frames, True)
+        gray_ms = encode_ms([gray] * frames, False)
+        encode_rows.append({'resolução': size, 'encoder_bgr_ms': round(bgr_ms, 2),
+                            'encoder_1canal_ms': round(gray_ms, 2),
+                            'speedup': round(bgr_ms / gray_ms, 2)})
+
+        for threads in args.threads:
+            cv2.setNumThreads(threads)
+            pool = FramePool()
+            thread_rows.append({'resolução': size, 'threads': threads, **{
+                f'{name}_ms': round(time_ms(lambda k=KERNELS[name]['bgr'][selected[f'{name}/bgr']]:
+                                            k(frame, pool=pool), args.repeat), 2)
+                for name in KERNELS
+            }})
+    configure_threads()
+
+    print(f"\nKernels x processing.py ({args.repeat} repetições, {os.cpu_count()} CPUs; "
+          f"max_dif contra a função original, * = escolhido pela sonda)")
+    print_table(rows)
+    print(f"\nGravação de frames em cinza ({args.encode_frames} frames)")
+    print_table(encode_rows)
+    print("\ncv2.setNumThreads")
+    print_table(thread_rows)
+
+
+# =====================================
+# Fila de processamento (jobqueue.py + worker.py)
+# =====================================
+
+def enqueue_synthetic(src: Path, filter_name: str) -> str:
+    """Cria um job como o upload do modo fila faria e o enfileira"""
+    import uuid
+    from config import INCOMING
+    from pipeline import new_job
+    import jobqueue
+
+    video_id = uuid.uuid4().hex
+    incoming = INCOMING / f'{video_id}{src.suffix}'
+    shutil.copyfile(src, incoming)
+    jobqueue.enqueue(new_job(video_id, src.name, src.suffix, filter_name, incoming))
+    return video_id
+
+
+def wait_jobs(ids: list[str], timeout: float = 600.0) -> list[dict]:
+    import jobqueue
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = [jobqueue.status(i) for i in ids]
+        if all(s['state'] in ('done', 'failed') for s in status):
+            return status
+        time.sleep(0.1)
+    raise RuntimeError("Jobs não terminaram no tempo limite")
+
+
+def bench_queue(args):
+    here = Path(__file__).parent
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        env = dict(os.environ, MEDIA_ROOT=str(tmp / 'media'), DB_PATH=str(tmp / 'videos.db'),
+                   PROCESSING_MODE='queue', WORKER_POLL_SEC='0.1')
+        os.environ.update(MEDIA_ROOT=env['MEDIA_ROOT'], DB_PATH=env['DB_PATH'])
+        from config import MEDIA_ROOT, INCOMING, VIDEOS
+        from db import init_db
+
+        for p in (MEDIA_ROOT, INCOMING, VIDEOS):
+            p.mkdir(parents=True, exist_ok=True)
+        init_db()
+        src = tmp / 'src.avi'
+        make_synthetic_video(src, args.width, args.height, args.frames)
+
+        def start_workers(count: int, drain: bool = True, **extra) -> list[subprocess.Popen]:
+            cmd = [sys.executable, 'worker.py'] + (['--drain'] if drain else [])
+            return [
+                subprocess.Popen(cmd, cwd=here, env=dict(env, **extra),
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                for _ in range(count)
+            ]
+
+        rows = []
+        for workers in args.workers:
+            ids = [enqueue_synthetic(src, args.filter) for _ in range(args.jobs)]
+            t0 = time.perf_counter()
+            procs = start_workers(workers)
+            status = wait_jobs(ids)
+            elapsed = time.perf_counter() - t0
+            for proc in procs:
+                proc.wait(timeout=60)
+            rows.append({
+                'workers': workers,
+                'jobs': len(ids),
+                'falhas': sum(s['state'] == 'failed' for s in status),
+                'seg': round(elapsed, 2),
+                'jobs_min': round(len(ids) / elapsed * 60, 1),
+            })
+        base_rate = rows[0]['jobs_min'] / rows[0]['workers']
+        for row in rows:
+            row['eficiência'] = round(row['jobs_min'] / (base_rate * row['workers']), 2)
+
+        # Worker morto no meio do job (SIGKILL): o lease vence e outro worker
+        # retoma do último segmento gravado
+        lease = {'QUEUE_LEASE_SEC': str(args.lease), 'QUEUE_HEARTBEAT_SEC': str(args.lease / 4),
+                 'SEGMENT_FRAMES': str(max(args.frames // 4, 1))}
+        video_id = enqueue_synthetic(src, args.filter)
+        victim = start_workers(1, **lease)[0]
+        import jobqueue
+        while (jobqueue.status(video_id) or {}).get('state') != 'running':
+            time.sleep(0.05)
+        time.sleep(args.kill_after)
+        victim.kill()
+        victim.wait()
+        killed_at = time.perf_counter()
+        # Sem --drain: o job só volta a ser entregue quando o lease vencer
+        rescuer = start_workers(1, drain=False, **lease)[0]
+        status = wait_jobs([video_id])[0]
+        recovery_sec = time.perf_counter() - killed_at
+        rescuer.terminate()
+        rescuer.wait(timeout=60)
+
+    print(f"\n{args.jobs} jobs {args.width}x{args.height} x {args.frames} frames, filtro {args.filter}, "
+          f"{os.cpu_count()} CPUs")
+    print_table(rows)
+    print(f"\nWorker morto após {args.kill_after}s de job (lease {args.lease}s): estado {status['state']}, "
+          f"{status['attempts']} entregas, concluído {recovery_sec:.2f}s após a morte")
+
+
+# =====================================
+# Entrypoint
+# =====================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do servidor")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p = sub.add_parser('pool', help="alocações e pico de RSS com e sem pool de buffers")
+    p.add_argument('--width', type=int, default=1920)
+    p.add_argument('--height', type=int, default=1080)
+    p.add_argument('--frames', type=int, default=120)
+    p.add_argument('--filter', default='gray')
+    p.set_defaults(func=bench_pool)
+
+    p = sub.add_parser('pipeline', help="process_video multiprocesso (FrameRing) x laço em thread")
+    p.add_argument('--width', type=int, default=1920)
+    p.add_argument('--height', type=int, default=1080)
+    p.add_argument('--frames', type=int, default=240)
+    p.add_argument('--filter', default='edges')
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser('tiering', help="bytes liberados e latência de restauração da camada fria")
+    p.add_argument('--videos', type=int, default=10)
+    p.add_argument('--width', type=int, default=1280)
+    p.add_argument('--height', type=int, default=720)
+    p.add_argument('--frames', type=int, default=150)
+    p.add_argument('--recompress', action='store_true')
+    p.set_defaults(func=bench_tiering)
+
+    p = sub.add_parser('previews', help="tamanho/tempo do preview animado x GIF legado e peso da galeria")
+    p.add_argument('--width', type=int, default=1280)
+    p.add_argument('--height', type=int, default=720)
+    p.add_argument('--frames', type=int, default=600)
+    p.add_argument('--scenes', type=int, default=4)
+    p.add_argument('--gallery', type=int, default=100)
+    p.set_defaults(func=bench_previews)
+
+    p = sub.add_parser('kernels', help="kernels dos filtros x funções de processing.py por resolução")
+    p.add_argument('--sizes', nargs='+', default=['854x480', '1280x720', '1920x1080'])
+    p.add_argument('--repeat', type=int, default=20)
+    p.add_argument('--encode-frames', type=int, default=30)
+    p.add_argument('--threads', type=int, nargs='+', default=sorted({1, os.cpu_count() or 1}))
+    p.set_defaults(func=bench_kernels)
+
+    p = sub.add_parser('queue', help="vazão da fila por número de workers e re-entrega após worker morto")
+    p.add_argument('--jobs', type=int, default=8)
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    p.add_argument('--width', type=int, default=1280)
+    p.add_argument('--height', type=int, default=720)
+    p.add_argument('--frames', type=int, default=120)
+    p.add_argument('--filter', default='edges')
+    p.add_argument('--lease', type=float, default=2.0)
+    p.add_argument('--kill-after', type=float, default=1.0)
+    p.set_defaults(func=bench_queue)
+
+    p = sub.add_parser('http', help="req/s em /videos e /media: servidor dev x serve.py")
+    p.add_argument('--rows', type=int, default=100)
+    p.add_argument('--media-kb', type=int, default=512)
+    p.add_argument('--concurrency', type=int, default=8)
+    p.add_argument('--duration', type=float, default=10.0)
+    p.set_defaults(func=bench_http)
+
+    p = sub.add_parser('search', help="busca FTS/índices x varredura em um catálogo sintético")
+    p.add_argument('--rows', type=int, default=1_000_000)
+    p.set_defaults(func=bench_search)
+
+    # Uso interno: uma execução isolada do benchmark de pool
+    if len(sys.argv) == 5 and sys.argv[1] == '_pool-run':
+        _, _, src, filter_name, reuse = sys.argv
+        print(json.dumps(run_pool_once(Path(src), filter_name, bool(int(reuse)))))
+        return
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
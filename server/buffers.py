@@ -0,0 +1,43 @@
+import numpy as np
+
+
+class FramePool:
+    """
+    Buffers de frame pré-alocados e reutilizados entre iterações.
+
+    Cada ponto do pipeline (decode, resize, filtros, assinatura) pede um
+    buffer pelo nome; enquanto forma e dtype não mudam, o mesmo array é
+    devolvido e passado ao OpenCV via dst=/image=, sem alocar por frame.
+
+    Com reuse=False todo get() aloca um array novo: serve de linha de base
+    para medir quantas alocações o pool evita (ver bench.py).
+    """
+
+    def __init__(self, reuse: bool = True):
+        self.reuse = reuse
+        self._buffers = {}
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.hits = 0
+
+    def get(self, name: str, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        buf = self._buffers.get(name)
+        if self.reuse and buf is not None and buf.shape == shape and buf.dtype == dtype:
+            self.hits += 1
+            return buf
+
+        buf = np.empty(shape, dtype)
+        self._buffers[name] = buf
+        self.allocations += 1
+        self.allocated_bytes += buf.nbytes
+        return buf
+
+    def stats(self) -> dict:
+        return {
+            'reuse': self.reuse,
+            'buffers': len(self._buffers),
+            'resident_bytes': sum(b.nbytes for b in self._buffers.values()),
+            'allocations': self.allocations,
+            'allocated_bytes': self.allocated_bytes,
+            'hits': self.hits,
+        }
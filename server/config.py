@@ -0,0 +1,32 @@
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MEDIA_ROOT = Path(os.getenv('MEDIA_ROOT', './media')).resolve()
+DB_PATH = Path(os.getenv('DB_PATH', str(Path(__file__).parent / 'videos.db'))).resolve()
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', '5000'))
+DEBUG = bool(int(os.getenv('DEBUG', '0')))
+
+# inline: o upload processa o vídeo na própria requisição;
+# queue: o upload só enfileira e os workers (worker.py) processam
+PROCESSING_MODE = os.getenv('PROCESSING_MODE', 'inline').lower()
+
+def server_processes() -> int:
+    """
+    Processos do servidor que dividem os núcleos do host. serve.py exporta
+    SERVER_PROCESSES com o número de workers do gunicorn antes de carregar
+    o app, por isso é lido na chamada e não na importação.
+    """
+    return max(int(os.getenv('SERVER_PROCESSES', '1')), 1)
+
+# meta.json deixou de ser gravado em todo upload; vira exportação sob demanda
+WRITE_META_JSON = bool(int(os.getenv('WRITE_META_JSON', '0')))
+
+INCOMING = MEDIA_ROOT / 'incoming'
+TRASH = MEDIA_ROOT / 'trash'
+VIDEOS = MEDIA_ROOT / 'videos'
+# Camada fria dos originais (ver tiering.py); pode ficar em outro disco
+COLD_ROOT = Path(os.getenv('COLD_ROOT', str(MEDIA_ROOT / 'cold'))).resolve()
@@ -1,14 +1,41 @@
+import re
 import sqlite3
-import json
 from pathlib import Path
 
-DB_PATH = Path(__file__).parent / 'videos.db'
+from config import DB_PATH
+
+# Colunas gravadas por insert_video/insert_videos. As URLs públicas não são
+# mais persistidas: são derivadas das colunas na leitura (ver app.public_urls).
+# A coluna legada `urls` fica no schema apenas por compatibilidade.
+VIDEO_COLUMNS = (
+    'id', 'original_name', 'ext', 'mime_type', 'size_bytes', 'duration_sec',
+    'fps', 'width', 'height', 'filter', 'created_at', 'path_original', 'path_processed',
+    'preview_file',
+)
 
 def get_conn():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
+def _backfill_preview_files(conn):
+    """
+    Preenche preview_file dos registros ainda NULL com o preview.* que
+    estiver em thumbs/; sem arquivo grava '' para não procurar de novo
+    """
+    rows = conn.execute('SELECT id, path_processed FROM videos WHERE preview_file IS NULL').fetchall()
+    updates = []
+    for row in rows:
+        name = ''
+        if row['path_processed']:
+            # .../<id>/processed/<filtro>/video.ext
+            thumbs = Path(row['path_processed']).parents[2] / 'thumbs'
+            previews = sorted(thumbs.glob('preview.*'))
+            if previews:
+                name = previews[0].name
+        updates.append((name, row['id']))
+    conn.executemany('UPDATE videos SET preview_file = ? WHERE id = ?', updates)
+
 def init_db():
     with get_conn() as conn:
         conn.execute(
@@ -26,84 +53,384 @@ def init_db():
                 created_at TEXT,
                 path_original TEXT,
                 path_processed TEXT,
-                urls TEXT
+                urls TEXT,
+                preview_file TEXT
+            );'''
+        )
+        # Bancos anteriores ao preview por vídeo: cria a coluna e a preenche
+        # a partir do disco, uma vez, para a listagem não procurar arquivos
+        columns = {r['name'] for r in conn.execute('PRAGMA table_info(videos)')}
+        if 'preview_file' not in columns:
+            conn.execute('ALTER TABLE videos ADD COLUMN preview_file TEXT')
+        _backfill_preview_files(conn)
+        # Chaves de idempotência de /upload: a chave é reservada antes do
+        # processamento, então uma repetição não duplica o trabalho
+        conn.execute(
+            '''CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
             );'''
         )
+        # Acessos e camada de armazenamento do original (ver tiering.py).
+        # A camada vigente é a de path_original; aqui ficam os contadores
+        conn.execute(
+            '''CREATE TABLE IF NOT EXISTS original_storage (
+                video_id TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                last_access_at TEXT,
+                moved_at TEXT,
+                hot_bytes INTEGER,
+                cold_bytes INTEGER,
+                codec TEXT,
+                restores INTEGER NOT NULL DEFAULT 0,
+                restore_ms REAL NOT NULL DEFAULT 0
+            );'''
+        )
+        # Fila de processamento do modo queue (ver jobqueue.py). Tempos em
+        # segundos Unix: o lease é comparado com time.time() dos workers
+        conn.execute(
+            '''CREATE TABLE IF NOT EXISTS job_queue (
+                id TEXT PRIMARY KEY,
+                base TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_until REAL,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                heartbeat_at REAL,
+                finished_at REAL,
+                error TEXT
+            );'''
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_job_queue_state ON job_queue (state, enqueued_at)')
+        init_search_index(conn)
+
+def init_search_index(conn):
+    """
+    Índice FTS5 sobre original_name (tabela de conteúdo externo: o texto
+    fica só em `videos`) mantido por triggers, e índices para os filtros
+    de atributo usados por search_videos.
+    """
+    has_fts = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'videos_fts'"
+    ).fetchone()
+    conn.executescript('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(
+            original_name,
+            content='videos', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER IF NOT EXISTS videos_fts_ai AFTER INSERT ON videos BEGIN
+            INSERT INTO videos_fts(rowid, original_name) VALUES (new.rowid, new.original_name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS videos_fts_ad AFTER DELETE ON videos BEGIN
+            INSERT INTO videos_fts(videos_fts, rowid, original_name)
+                VALUES ('delete', old.rowid, old.original_name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS videos_fts_au AFTER UPDATE OF original_name ON videos BEGIN
+            INSERT INTO videos_fts(videos_fts, rowid, original_name)
+                VALUES ('delete', old.rowid, old.original_name);
+            INSERT INTO videos_fts(rowid, original_name) VALUES (new.rowid, new.original_name);
+        END;
+
+        CREATE INDEX IF NOT EXISTS idx_videos_created ON videos (created_at);
+        CREATE INDEX IF NOT EXISTS idx_videos_filter_created ON videos (filter, created_at);
+        CREATE INDEX IF NOT EXISTS idx_videos_dims ON videos (width, height);
+        CREATE INDEX IF NOT EXISTS idx_videos_fps ON videos (fps);
+    ''')
+    if not has_fts:
+        # Banco já existente: indexa as linhas gravadas antes do FTS
+        conn.execute("INSERT INTO videos_fts(videos_fts) VALUES ('rebuild')")
+
+_INSERT_SQL = (
+    f"INSERT INTO videos ({', '.join(VIDEO_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in VIDEO_COLUMNS)})"
+)
+_SELECT_COLUMNS = ', '.join(VIDEO_COLUMNS)
+
+def _row_values(meta):
+    return tuple(meta.get(col) for col in VIDEO_COLUMNS)
 
 def insert_video(meta):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # garante que urls seja string JSON
-    urls_json = json.dumps(meta["urls"]) if isinstance(meta["urls"], dict) else meta["urls"]
-
-    c.execute("""
-        INSERT INTO videos (
-            id, original_name, ext, mime_type, size_bytes, duration_sec,
-            fps, width, height, filter, created_at, path_original, path_processed, urls
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        meta.get("id"),
-        meta.get("original_name"),
-        meta.get("ext"),
-        meta.get("mime_type"),
-        meta.get("size_bytes"),
-        meta.get("duration_sec"),
-        meta.get("fps"),
-        meta.get("width"),
-        meta.get("height"),
-        meta.get("filter"),
-        meta.get("created_at"),
-        meta.get("path_original"),
-        meta.get("path_processed"),
-        urls_json   # 👈 aqui sempre vai JSON válido
-    ))
-    
-    conn.commit()
-    conn.close()
+    with get_conn() as conn:
+        conn.execute(_INSERT_SQL, _row_values(meta))
+
+def insert_videos(metas, replace=False):
+    """Insere vários registros numa única transação (ver rebuild_db.py)"""
+    if replace:
+        # UPSERT em vez de INSERT OR REPLACE: o REPLACE apaga a linha sem
+        # disparar o trigger de delete e deixaria o índice FTS desatualizado
+        updates = ', '.join(f'{c} = excluded.{c}' for c in VIDEO_COLUMNS if c != 'id')
+        sql = f'{_INSERT_SQL} ON CONFLICT(id) DO UPDATE SET {updates}'
+    else:
+        sql = _INSERT_SQL.replace('INSERT', 'INSERT OR IGNORE', 1)
+    with get_conn() as conn:
+        cur = conn.executemany(sql, (_row_values(m) for m in metas))
+        return cur.rowcount
+
+def list_video_ids():
+    with get_conn() as conn:
+        return {r[0] for r in conn.execute('SELECT id FROM videos')}
 
 def list_videos(limit=100):
     with get_conn() as conn:
-        cur = conn.execute('SELECT * FROM videos ORDER BY created_at DESC LIMIT ?', (limit,))
-        rows = [dict(r) for r in cur.fetchall()]
+        cur = conn.execute(
+            f'SELECT {_SELECT_COLUMNS} FROM videos ORDER BY created_at DESC LIMIT ?', (limit,)
+        )
+        return [dict(r) for r in cur.fetchall()]
 
-    for r in rows:
-        # tenta carregar urls como JSON
-        try:
-            r["urls"] = json.loads(r["urls"]) if r.get("urls") else {}
-        except Exception:
-            r["urls"] = {}
 
-        # garante todas as chaves
-        for k in ["view", "original", "processed", "thumb", "gif"]:
-            r["urls"].setdefault(k, "")
+def _fts_query(text: str) -> str | None:
+    """Transforma o texto livre em consulta FTS5: todos os termos, por prefixo"""
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return None
+    return ' AND '.join(f'"{t}"*' for t in terms)
 
-    return rows
+# Filtros de atributo aceitos por search_videos: nome -> condição SQL
+_SEARCH_FILTERS = {
+    'filter': 'filter = ?',
+    'min_width': 'width >= ?',
+    'max_width': 'width <= ?',
+    'min_height': 'height >= ?',
+    'max_height': 'height <= ?',
+    'min_fps': 'fps >= ?',
+    'max_fps': 'fps <= ?',
+    'created_from': 'created_at >= ?',
+    'created_to': 'created_at < ?',
+}
+
+def search_videos(q: str | None = None, limit: int = 50, offset: int = 0, **filters):
+    """
+    Busca por nome (FTS5) combinada com filtros de atributo
+    (ver _SEARCH_FILTERS), mais recentes primeiro.
+    """
+    where, params = [], []
+    if q:
+        match = _fts_query(q)
+        if match is None:
+            return []
+        where.append('rowid IN (SELECT rowid FROM videos_fts WHERE videos_fts MATCH ?)')
+        params.append(match)
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name not in _SEARCH_FILTERS:
+            raise ValueError(f"Filtro de busca desconhecido: {name}")
+        where.append(_SEARCH_FILTERS[name])
+        params.append(value)
+
+    sql = f'SELECT {_SELECT_COLUMNS} FROM videos'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY created_at DESC LIMIT ? OFFSET ?'
+    with get_conn() as conn:
+        cur = conn.execute(sql, (*params, limit, offset))
+        return [dict(r) for r in cur.fetchall()]
 
 
 def get_video(video_id: str):
     with get_conn() as conn:
-        cur = conn.execute('SELECT * FROM videos WHERE id = ? LIMIT 1', (video_id,))
+        cur = conn.execute(f'SELECT {_SELECT_COLUMNS} FROM videos WHERE id = ? LIMIT 1', (video_id,))
         row = cur.fetchone()
 
-    if not row:
-        return None
+    return dict(row) if row else None
 
-    r = dict(row)
+def delete_video_db(video_id: str):
+    with get_conn() as conn:
+        conn.execute('DELETE FROM videos WHERE id = ?', (video_id,))
+        conn.execute('DELETE FROM idempotency_keys WHERE video_id = ?', (video_id,))
+        conn.execute('DELETE FROM original_storage WHERE video_id = ?', (video_id,))
+        conn.commit()
 
-    # tenta carregar urls como JSON
-    try:
-        r["urls"] = json.loads(r["urls"]) if r.get("urls") else {}
-    except Exception:
-        r["urls"] = {}
+def claim_idempotency_key(key: str, video_id: str):
+    """Reserva a chave para video_id; se já existir, retorna o video_id dono dela"""
+    with get_conn() as conn:
+        cur = conn.execute(
+            'INSERT OR IGNORE INTO idempotency_keys (key, video_id) VALUES (?, ?)', (key, video_id)
+        )
+        if cur.rowcount == 1:
+            return None
+        row = conn.execute('SELECT video_id FROM idempotency_keys WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
 
-    # garante todas as chaves
-    for k in ["view", "original", "processed", "thumb", "gif"]:
-        r["urls"].setdefault(k, "")
+def release_idempotency_key(key: str):
+    with get_conn() as conn:
+        conn.execute('DELETE FROM idempotency_keys WHERE key = ?', (key,))
 
-    return r
 
-def delete_video_db(video_id: str):
+def record_original_access(video_id: str, accessed_at: str):
     with get_conn() as conn:
-        conn.execute('DELETE FROM videos WHERE id = ?', (video_id,))
-        conn.commit()
\ No newline at end of file
+        conn.execute(
+            '''INSERT INTO original_storage (video_id, hits, last_access_at) VALUES (?, 1, ?)
+               ON CONFLICT(video_id) DO UPDATE SET hits = hits + 1, last_access_at = excluded.last_access_at''',
+            (video_id, accessed_at),
+        )
+
+def list_tier_candidates(cold_prefix: str, idle_before: str, rare_before: str, rare_hits: int):
+    """
+    Originais ainda fora de `cold_prefix` sem acesso desde `idle_before`,
+    ou criados antes de `rare_before` e servidos menos de `rare_hits` vezes.
+    O prefixo é comparado com substr e não com LIKE: caminhos podem ter
+    % e _, e o LIKE ignora maiúsculas.
+    """
+    with get_conn() as conn:
+        cur = conn.execute(
+            '''SELECT v.id, v.path_original, v.created_at,
+                      COALESCE(s.hits, 0) AS hits, s.last_access_at
+               FROM videos v LEFT JOIN original_storage s ON s.video_id = v.id
+               WHERE v.path_original IS NOT NULL AND substr(v.path_original, 1, length(?)) != ?
+                 AND (COALESCE(s.last_access_at, v.created_at) < ?
+                      OR (v.created_at < ? AND COALESCE(s.hits, 0) < ?))
+               ORDER BY v.created_at''',
+            (cold_prefix, cold_prefix, idle_before, rare_before, rare_hits),
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+def set_original_location(video_id: str, path_original: str, **storage):
+    """Atualiza path_original e os campos de original_storage numa transação"""
+    with get_conn() as conn:
+        conn.execute('UPDATE videos SET path_original = ? WHERE id = ?', (path_original, video_id))
+        conn.execute('INSERT OR IGNORE INTO original_storage (video_id) VALUES (?)', (video_id,))
+        if storage:
+            assignments = ', '.join(f'{k} = ?' for k in storage)
+            conn.execute(
+                f'UPDATE original_storage SET {assignments} WHERE video_id = ?',
+                (*storage.values(), video_id),
+            )
+
+def record_original_restore(video_id: str, path_original: str, restore_ms: float, restored_at: str):
+    with get_conn() as conn:
+        conn.execute('UPDATE videos SET path_original = ? WHERE id = ?', (path_original, video_id))
+        conn.execute(
+            '''UPDATE original_storage
+               SET restores = restores + 1, restore_ms = restore_ms + ?, last_access_at = ?
+               WHERE video_id = ?''',
+            (restore_ms, restored_at, video_id),
+        )
+
+def original_storage_report(cold_prefix: str) -> dict:
+    with get_conn() as conn:
+        row = conn.execute(
+            '''SELECT COUNT(*) AS cold_videos,
+                      COALESCE(SUM(s.hot_bytes), 0) AS hot_bytes,
+                      COALESCE(SUM(s.cold_bytes), 0) AS cold_bytes
+               FROM videos v JOIN original_storage s ON s.video_id = v.id
+               WHERE substr(v.path_original, 1, length(?)) = ?''',
+            (cold_prefix, cold_prefix),
+        ).fetchone()
+        restores = conn.execute(
+            'SELECT COALESCE(SUM(restores), 0), COALESCE(SUM(restore_ms), 0) FROM original_storage'
+        ).fetchone()
+        total = conn.execute('SELECT COUNT(*) FROM videos WHERE path_original IS NOT NULL').fetchone()[0]
+
+    report = dict(row)
+    report['hot_videos'] = total - report['cold_videos']
+    report['restores'] = restores[0]
+    report['avg_restore_ms'] = round(restores[1] / restores[0], 2) if restores[0] else None
+    return report
+
+
+def enqueue_job(job_id: str, base: str, enqueued_at: float):
+    """Coloca o job na fila (ou de volta nela, zerando as tentativas)"""
+    with get_conn() as conn:
+        conn.execute(
+            '''INSERT INTO job_queue (id, base, enqueued_at) VALUES (?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET
+                   base = excluded.base, enqueued_at = excluded.enqueued_at, state = 'queued',
+                   attempts = 0, worker = NULL, lease_until = NULL, finished_at = NULL, error = NULL''',
+            (job_id, base, enqueued_at),
+        )
+
+def claim_queued_job(worker: str, now: float, lease_until: float, max_attempts: int):
+    """
+    Entrega ao worker o job mais antigo disponível: na fila, ou em execução
+    com lease vencido (worker morto) e tentativas sobrando. Um único UPDATE
+    com RETURNING: dois workers nunca recebem o mesmo job.
+    """
+    with get_conn() as conn:
+        rows = conn.execute(
+            '''UPDATE job_queue
+               SET state = 'running', worker = ?, attempts = attempts + 1,
+                   lease_until = ?, started_at = ?, heartbeat_at = ?
+               WHERE id = (
+                   SELECT id FROM job_queue
+                   WHERE state = 'queued'
+                      OR (state = 'running' AND lease_until < ? AND attempts < ?)
+                   ORDER BY enqueued_at LIMIT 1
+               )
+               RETURNING *''',
+            (worker, lease_until, now, now, now, max_attempts),
+        ).fetchall()
+        return dict(rows[0]) if rows else None
+
+def expire_queued_jobs(now: float, expired_before: float, max_attempts: int, error: str):
+    """
+    Marca como falhos os jobs sem tentativas cujo lease venceu antes de
+    `expired_before`; retorna-os
+    """
+    with get_conn() as conn:
+        cur = conn.execute(
+            '''UPDATE job_queue SET state = 'failed', finished_at = ?, error = ?, lease_until = NULL
+               WHERE state = 'running' AND lease_until < ? AND attempts >= ?
+               RETURNING *''',
+            (now, error, expired_before, max_attempts),
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+def renew_job_lease(job_id: str, worker: str, now: float, lease_until: float) -> bool:
+    """Heartbeat: estende o lease se o job ainda for deste worker"""
+    with get_conn() as conn:
+        cur = conn.execute(
+            '''UPDATE job_queue SET lease_until = ?, heartbeat_at = ?
+               WHERE state = 'running' AND id = ? AND worker = ?''',
+            (lease_until, now, job_id, worker),
+        )
+        return cur.rowcount == 1
+
+def set_job_state(job_id: str, worker: str, state: str, now: float, error: str | None = None) -> bool:
+    """
+    Encerra a execução do worker: 'done', 'failed' ou 'queued' (nova
+    tentativa). Não faz nada se o lease já tiver passado para outro worker.
+    """
+    finished_at = now if state in ('done', 'failed') else None
+    with get_conn() as conn:
+        cur = conn.execute(
+            '''UPDATE job_queue SET state = ?, error = ?, finished_at = ?, lease_until = NULL
+               WHERE state = 'running' AND id = ? AND worker = ?''',
+            (state, error, finished_at, job_id, worker),
+        )
+        return cur.rowcount == 1
+
+def get_queued_job(job_id: str):
+    with get_conn() as conn:
+        row = conn.execute('SELECT * FROM job_queue WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+def list_active_job_ids():
+    """Jobs na fila ou em execução (recovery.py não deve mexer neles)"""
+    with get_conn() as conn:
+        return {r[0] for r in conn.execute("SELECT id FROM job_queue WHERE state IN ('queued', 'running')")}
+
+def job_queue_stats(now: float) -> dict:
+    with get_conn() as conn:
+        counts = dict(conn.execute('SELECT state, COUNT(*) FROM job_queue GROUP BY state').fetchall())
+        row = conn.execute(
+            '''SELECT MIN(CASE WHEN state = 'queued' THEN enqueued_at END) AS oldest_queued,
+                      COUNT(DISTINCT CASE WHEN state = 'running' AND lease_until >= ? THEN worker END) AS workers,
+                      AVG(CASE WHEN state = 'done' THEN finished_at - started_at END) AS avg_job_sec
+               FROM job_queue''',
+            (now,),
+        ).fetchone()
+
+    return {
+        'queued': counts.get('queued', 0),
+        'running': counts.get('running', 0),
+        'done': counts.get('done', 0),
+        'failed': counts.get('failed', 0),
+        'active_workers': row['workers'],
+        'oldest_queued_sec': round(now - row['oldest_queued'], 1) if row['oldest_queued'] else None,
+        'avg_job_sec': round(row['avg_job_sec'], 2) if row['avg_job_sec'] is not None else None,
+    }
@@ -0,0 +1,184 @@
+import time
+import tempfile
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from utils import ALLOWED_EXTENSIONS
+
+# fourccs testados, em ordem de preferência quando o desempenho empata
+CANDIDATE_FOURCCS = ('avc1', 'mp4v', 'XVID', 'MJPG')
+# Os que a tag <video> dos navegadores toca (H.264); vêm sempre primeiro
+# nas saídas servidas ao player, mesmo que outro codifique mais rápido
+BROWSER_FOURCCS = ('avc1',)
+# Tags que cada container aceita como estão. Fora daqui o FFmpeg troca a
+# tag por outra (ex.: XVID num .mp4 vira mp4v), então nem entram na sonda
+CONTAINER_FOURCCS = {
+    '.mp4': ('avc1', 'mp4v'),
+    '.mov': ('avc1', 'mp4v'),
+}
+
+# Parâmetros do teste de codificação
+PROBE_SIZE = (320, 240)
+PROBE_FRAMES = 30
+PROBE_FPS = 30.0
+# Repetições por par fourcc/container; vale a mediana (uma amostra só é ruidosa)
+PROBE_REPEATS = 3
+
+# Um codec é "aceitável" se o arquivo gerado não passar deste múltiplo do
+# menor arquivo obtido para o mesmo container (evita cair no MJPG à toa)
+SIZE_TOLERANCE = 3.0
+# Codecs com velocidade a até 20% um do outro contam como empate
+SPEED_TOLERANCE = 0.8
+
+# Ordem usada antes da sonda rodar (mesmo comportamento de antes)
+DEFAULT_RANKING = ('avc1', 'MJPG')
+
+_lock = threading.Lock()
+_results = None
+
+
+def _probe_frames():
+    width, height = PROBE_SIZE
+    base = np.zeros((height, width, 3), np.uint8)
+    base[:] = np.linspace(0, 255, width, dtype=np.uint8)[None, :, None]
+    for i in range(PROBE_FRAMES):
+        frame = base.copy()
+        cv2.circle(frame, ((i * 10) % width, height // 2), 30, (0, 200, 255), -1)
+        yield frame
+
+
+def probe_encoder(fourcc: str, ext: str, tmp_dir: Path) -> dict:
+    """Codifica alguns frames com o par fourcc/container e mede velocidade e tamanho"""
+    path = tmp_dir / f'probe_{fourcc}{ext}'
+    result = {'fourcc': fourcc, 'ext': ext, 'ok': False}
+
+    frames = list(_probe_frames())
+    timings = []
+    for _ in range(PROBE_REPEATS):
+        t0 = time.perf_counter()
+        out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*fourcc), PROBE_FPS, PROBE_SIZE)
+        if not out.isOpened():
+            result['error'] = 'VideoWriter não abriu'
+            return result
+        for frame in frames:
+            out.write(frame)
+        out.release()
+        timings.append(time.perf_counter() - t0)
+    elapsed = sorted(timings)[len(timings) // 2]
+
+    if not path.exists() or path.stat().st_size == 0:
+        result['error'] = 'arquivo vazio'
+        return result
+
+    # Confere se o resultado é legível
+    cap = cv2.VideoCapture(str(path))
+    readable = cap.isOpened() and cap.read()[0]
+    cap.release()
+    if not readable:
+        result['error'] = 'saída ilegível'
+        return result
+
+    result.update({
+        'ok': True,
+        'encode_fps': round(PROBE_FRAMES / elapsed, 1),
+        'bytes': path.stat().st_size,
+    })
+    return result
+
+
+def container_fourccs(ext: str) -> tuple[str, ...]:
+    return CONTAINER_FOURCCS.get(ext.lower(), CANDIDATE_FOURCCS)
+
+
+def _rank_by_speed(working: list[dict]) -> list[str]:
+    """
+    Codecs aceitáveis do mais rápido ao mais lento; os demais, por tamanho.
+    Velocidades a até SPEED_TOLERANCE da mais rápida de cada faixa empatam
+    e ficam na ordem de CANDIDATE_FOURCCS.
+    """
+    if not working:
+        return []
+    smallest = min(r['bytes'] for r in working)
+    acceptable = [r for r in working if r['bytes'] <= smallest * SIZE_TOLERANCE]
+    others = [r for r in working if r not in acceptable]
+
+    ranked = []
+    pending = sorted(acceptable, key=lambda r: -r['encode_fps'])
+    while pending:
+        floor = pending[0]['encode_fps'] * SPEED_TOLERANCE
+        tied = [r for r in pending if r['encode_fps'] >= floor]
+        pending = [r for r in pending if r['encode_fps'] < floor]
+        ranked += sorted(tied, key=lambda r: CANDIDATE_FOURCCS.index(r['fourcc']))
+
+    others.sort(key=lambda r: r['bytes'])
+    return [r['fourcc'] for r in ranked + others]
+
+
+def rank(results: list[dict], web: bool = True) -> list[str]:
+    """
+    Ordem de preferência dos codecs que funcionaram. Com web=True (vídeos
+    servidos ao <video>) os de BROWSER_FOURCCS vêm antes e velocidade e
+    tamanho só desempatam dentro de cada grupo; com web=False vale só o
+    desempenho.
+    """
+    working = [r for r in results if r['ok']]
+    if not web:
+        return _rank_by_speed(working)
+    playable = [r for r in working if r['fourcc'] in BROWSER_FOURCCS]
+    return _rank_by_speed(playable) + _rank_by_speed([r for r in working if r not in playable])
+
+
+def probe_encoders(force: bool = False) -> dict:
+    """
+    Testa os pares fourcc/container suportados (CONTAINER_FOURCCS) num
+    diretório temporário e guarda o ranking por container. Roda uma vez
+    por processo (ver create_app).
+    """
+    global _results
+    with _lock:
+        if _results is not None and not force:
+            return _results
+
+        t0 = time.perf_counter()
+        by_ext = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for ext in sorted(ALLOWED_EXTENSIONS):
+                probes = [probe_encoder(fourcc, ext, Path(tmp)) for fourcc in container_fourccs(ext)]
+                by_ext[ext] = {
+                    'ranking': rank(probes),
+                    'ranking_any': rank(probes, web=False),
+                    'probes': probes,
+                }
+
+        _results = {
+            'opencv': cv2.__version__,
+            'probe_sec': round(time.perf_counter() - t0, 3),
+            'containers': by_ext,
+        }
+        print(f"Codecs por container: { {e: r['ranking'] for e, r in by_ext.items()} }")
+        return _results
+
+
+def encoder_ranking(ext: str, web: bool = True) -> list[str]:
+    results = probe_encoders()
+    ranking = results['containers'].get(ext.lower(), {}).get('ranking' if web else 'ranking_any')
+    return ranking or list(DEFAULT_RANKING)
+
+
+def open_writer(path: Path, fps: float, size: tuple[int, int], is_color: bool = True, web: bool = True):
+    """
+    Abre um VideoWriter com o melhor codec disponível para o container
+    de `path`, caindo para os próximos do ranking se algum falhar.
+    Com is_color=False o writer recebe frames de 1 canal; web=False é para
+    arquivos que não vão para o player (só o desempenho conta).
+    Retorna (writer, fourcc) ou (None, None).
+    """
+    for fourcc in encoder_ranking(path.suffix, web):
+        out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*fourcc), fps, size, is_color)
+        if out.isOpened():
+            return out, fourcc
+        out.release()
+    return None, None
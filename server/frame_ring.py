@@ -0,0 +1,52 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class FrameRing:
+    """
+    Anel de slots de frame em memória compartilhada (multiprocessing.shared_memory).
+
+    Todos os processos do pipeline (decodificador, workers de filtro e
+    codificador) mapeiam o mesmo bloco e enxergam cada slot como uma view
+    NumPy; pelas filas só trafegam índices de slot, nunca os pixels.
+
+    O processo que cria o anel é o dono e remove o bloco em close().
+    Os demais usam FrameRing.attach(*ring.spec()).
+    """
+
+    def __init__(self, shape: tuple, slots: int, name: str | None = None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.frame_bytes = int(np.prod(self.shape))
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.frame_bytes * slots)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self._views = [
+            np.ndarray(self.shape, np.uint8, buffer=self.shm.buf, offset=i * self.frame_bytes)
+            for i in range(slots)
+        ]
+
+    @classmethod
+    def attach(cls, name: str, shape: tuple, slots: int) -> 'FrameRing':
+        return cls(shape, slots, name=name)
+
+    def spec(self) -> tuple:
+        """Argumentos (picklable) para outro processo chamar attach()"""
+        return self.shm.name, self.shape, self.slots
+
+    def view(self, slot: int) -> np.ndarray:
+        return self._views[slot]
+
+    @property
+    def nbytes(self) -> int:
+        return self.frame_bytes * self.slots
+
+    def close(self):
+        # As views precisam sumir antes: o buffer não fecha com exports vivos
+        self._views = []
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,150 @@
+"""
+Fila de processamento compartilhada entre o tier web e os workers.
+
+Com PROCESSING_MODE=queue o upload só grava o arquivo em incoming/, cria
+o job.json e enfileira o id; qualquer número de workers (worker.py), em
+qualquer host que enxergue o mesmo MEDIA_ROOT e o mesmo videos.db, pega
+jobs da tabela job_queue e executa pipeline.run_job.
+
+A fila é o próprio SQLite (stand-in de um broker):
+
+  - claim() entrega um job com um lease de QUEUE_LEASE_SEC segundos;
+  - enquanto processa, o worker renova o lease (Heartbeat) a cada
+    QUEUE_HEARTBEAT_SEC;
+  - se o worker morrer, o lease vence e o job volta a ser entregue a
+    outro worker, que retoma do job.json/checkpoint (ver pipeline.py);
+  - depois de QUEUE_MAX_ATTEMPTS entregas o job é marcado como falho.
+
+O SQLite precisa de lock de arquivo confiável: vários workers num host,
+ou um disco compartilhado que o suporte. Para vários hosts em rede, a
+mesma interface pode ser implementada sobre um broker de verdade.
+"""
+import os
+import time
+import socket
+import threading
+
+from db import (
+    enqueue_job, claim_queued_job, expire_queued_jobs, renew_job_lease,
+    set_job_state, get_queued_job, list_active_job_ids, job_queue_stats,
+)
+
+QUEUE_LEASE_SEC = float(os.getenv('QUEUE_LEASE_SEC', '60'))
+QUEUE_HEARTBEAT_SEC = float(os.getenv('QUEUE_HEARTBEAT_SEC', str(QUEUE_LEASE_SEC / 4)))
+QUEUE_MAX_ATTEMPTS = int(os.getenv('QUEUE_MAX_ATTEMPTS', '3'))
+# Jobs esperando na fila acima dos quais o upload devolve 429 (0 = sem limite)
+QUEUE_MAX_PENDING = int(os.getenv('QUEUE_MAX_PENDING', '0'))
+
+
+class QueueFull(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def worker_id() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def check_capacity():
+    """Lança QueueFull se a fila já tiver QUEUE_MAX_PENDING jobs esperando"""
+    if QUEUE_MAX_PENDING <= 0:
+        return
+    stats = job_queue_stats(time.time())
+    if stats['queued'] < QUEUE_MAX_PENDING:
+        return
+    # Tempo para a fila andar um job com os workers ativos
+    retry_after = (stats['avg_job_sec'] or 5) / max(stats['active_workers'], 1)
+    raise QueueFull(f"Fila cheia ({stats['queued']} jobs esperando)", max(int(retry_after), 1))
+
+
+def enqueue(job: dict):
+    enqueue_job(job['id'], job['base'], time.time())
+
+
+def claim(worker: str) -> dict | None:
+    now = time.time()
+    return claim_queued_job(worker, now, now + QUEUE_LEASE_SEC, QUEUE_MAX_ATTEMPTS)
+
+
+def expire() -> list[dict]:
+    """
+    Jobs cujo worker morreu na última tentativa; o chamador os descarta.
+    Só conta o lease vencido há mais de QUEUE_LEASE_SEC: um worker vivo
+    com o heartbeat atrasado (banco ocupado) ainda renova antes disso, e
+    o diretório dele não vai para a trash no meio do job.
+    """
+    now = time.time()
+    return expire_queued_jobs(now, now - QUEUE_LEASE_SEC, QUEUE_MAX_ATTEMPTS,
+                              "Lease vencido na última tentativa")
+
+
+def renew(job_id: str, worker: str) -> bool:
+    """Estende o lease; False se o job já não for deste worker"""
+    now = time.time()
+    return renew_job_lease(job_id, worker, now, now + QUEUE_LEASE_SEC)
+
+
+def complete(job_id: str, worker: str) -> bool:
+    return set_job_state(job_id, worker, 'done', time.time())
+
+
+def fail(item: dict, worker: str, error: str, retry: bool = True) -> str | None:
+    """
+    Devolve o job à fila se ainda houver tentativas; senão marca como falho.
+    Retorna o novo estado (None se o lease já era de outro worker).
+    """
+    state = 'queued' if retry and item['attempts'] < QUEUE_MAX_ATTEMPTS else 'failed'
+    return state if set_job_state(item['id'], worker, state, time.time(), error) else None
+
+
+def status(job_id: str) -> dict | None:
+    return get_queued_job(job_id)
+
+
+def active_ids() -> set[str]:
+    return list_active_job_ids()
+
+
+def stats() -> dict:
+    result = job_queue_stats(time.time())
+    result.update(lease_sec=QUEUE_LEASE_SEC, max_attempts=QUEUE_MAX_ATTEMPTS, max_pending=QUEUE_MAX_PENDING)
+    return result
+
+
+class Heartbeat:
+    """
+    Renova o lease do job em segundo plano enquanto o bloco `with` roda.
+    Se a renovação falhar (o lease venceu e o job foi entregue a outro
+    worker), `lost` fica True.
+    """
+
+    def __init__(self, job_id: str, worker: str, interval: float = QUEUE_HEARTBEAT_SEC):
+        self.job_id = job_id
+        self.worker = worker
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'heartbeat-{job_id}', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                renewed = renew(self.job_id, self.worker)
+            except Exception as e:
+                # Banco ocupado/indisponível: tenta de novo no próximo ciclo
+                print(f"Heartbeat do job {self.job_id} falhou: {e}")
+                continue
+            if not renewed:
+                self.lost = True
+                print(f"Lease do job {self.job_id} perdido por {self.worker}")
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,288 @@
+"""
+Kernels dos filtros, escolhidos em tempo de execução.
+
+Cada filtro tem mais de uma implementação (kernel) e a sonda de
+select_kernels() mede todas num frame sintético, confere a saída contra a
+referência do filtro e fica com a mais rápida que passar. Um filtro pode
+ter dois modos:
+
+  - 'bgr':  saída BGR de 3 canais (o que os writers sempre receberam);
+  - 'gray': saída de 1 canal, gravada com VideoWriter(isColor=False) e
+            sem a conversão de volta para BGR a cada frame.
+
+KERNEL_<FILTRO>=<nome> força um kernel (ex.: KERNEL_PIXELATE=linear volta
+à amostragem bilinear antiga, que a sonda descarta por não ser média).
+
+Como os filtros de processing.py, os kernels recebem um FramePool e
+escrevem intermediários e saída em buffers reutilizados.
+"""
+import os
+import time
+import threading
+
+import cv2
+import numpy as np
+
+from buffers import FramePool
+
+# Saída em 1 canal para filtros em cinza (0 volta a gravar sempre BGR)
+SINGLE_CHANNEL_OUTPUT = bool(int(os.getenv('SINGLE_CHANNEL_OUTPUT', '1')))
+# Threads internas do OpenCV por processo (0 = núcleos / (jobs simultâneos x workers do servidor))
+OPENCV_THREADS = int(os.getenv('OPENCV_THREADS', '0'))
+
+PIXELATE_BLOCK = 16
+
+# Parâmetros da sonda
+PROBE_SIZE = (1280, 720)
+PROBE_REPEATS = 3
+
+# Pesos BT.601 na ordem BGR, os mesmos do COLOR_BGR2GRAY
+_GRAY_WEIGHTS = np.array([0.114, 0.587, 0.299], np.float32)
+_GRAY_MATRIX = np.tile(_GRAY_WEIGHTS, (3, 1))
+
+_ALIASES = {'gray': 'grayscale'}
+
+_lock = threading.Lock()
+_results = None
+
+
+def _gray(frame: np.ndarray, pool: FramePool) -> np.ndarray:
+    """Canal de luminância, sem conversão se o frame já for cinza"""
+    if frame.ndim == 2:
+        return frame
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=pool.get('gray', frame.shape[:2]))
+
+
+# =====================================
+# Tons de cinza
+# =====================================
+
+def grayscale_cvtcolor(frame: np.ndarray, pool: FramePool) -> np.ndarray:
+    """Implementação original: BGR -> cinza -> BGR"""
+    gray = _gray(frame, pool)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=pool.get('filtered', gray.shape + (3,)))
+
+
+def grayscale_transform(frame: np.ndarray, pool: FramePool) -> np.ndarray:
+    """Uma passada só: a mesma soma ponderada escrita nos 3 canais"""
+    if frame.ndim == 2:
+        return grayscale_cvtcolor(frame, pool)
+    return cv2.transform(frame, _GRAY_MATRIX, dst=pool.get('filtered', frame.shape))
+
+
+def grayscale_single(frame: np.ndarray, pool: FramePool) -> np.ndarray:
+    if frame.ndim == 2:
+        return frame
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=pool.get('filtered', frame.shape[:2]))
+
+
+# =====================================
+# Pixelização
+# =====================================
+
+def _pixelate_grid(frame: np.ndarray, block_size: int) -> tuple[int, int]:
+    height, width = frame.shape[:2]
+    return max(height // block_size, 1), max(width // block_size, 1)
+
+
+def _upscale(small: np.ndarray, frame: np.ndarray, pool: FramePool) -> np.ndarray:
+    height, width = frame.shape[:2]
+    return cv2.resize(small, (width, height), dst=pool.get('filtered', frame.shape),
+                      interpolation=cv2.INTER_NEAREST)
+
+
+def _block_means_integral(frame: np.ndarray, block_size: int, pool: FramePool) -> np.ndarray:
+    """
+    Média inteira de cada bloco pela imagem integral: quatro leituras por
+    bloco e divisão com arredondamento, sem ponto flutuante.
+    """
+    height, width = frame.shape[:2]
+    rows, cols = _pixelate_grid(frame, block_size)
+    if height < block_size or width < block_size:
+        return cv2.resize(frame, (cols, rows), interpolation=cv2.INTER_AREA)
+
+    region = frame[:rows * block_size, :cols * block_size]
+    channels = frame.shape[2:]
+    # Acima de 4K a soma passa de 2^31, mas a diferença entre cantos
+    # continua exata na aritmética módulo 2^32 do int32
+    total = cv2.integral(region, sum=pool.get('integral', (region.shape[0] + 1, region.shape[1] + 1) + channels,
+                                              np.int32), sdepth=cv2.CV_32S)
+    corners = total[::block_size, ::block_size]
+    sums = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+    area = block_size * block_size
+    small = pool.get('small', (rows, cols) + channels)
+    np.floor_divide(sums + area // 2, area, out=sums)
+    np.copyto(small, sums, casting='unsafe')
+    return small
+
+
+def pixelate_integral(frame: np.ndarray, pool: FramePool, block_size: int = PIXELATE_BLOCK) -> np.ndarray:
+    return _upscale(_block_means_integral(frame, block_size, pool), frame, pool)
+
+
+def pixelate_halving(frame: np.ndarray, pool: FramePool, block_size: int = PIXELATE_BLOCK) -> np.ndarray:
+    """
+    Para blocos potência de 2: reduções sucessivas pela metade com
+    INTER_AREA, que nesse fator usa o caminho inteiro vetorizado do OpenCV.
+    """
+    height, width = frame.shape[:2]
+    if block_size & (block_size - 1) or height < block_size or width < block_size:
+        return pixelate_integral(frame, pool, block_size)
+
+    rows, cols = _pixelate_grid(frame, block_size)
+    small = frame[:rows * block_size, :cols * block_size]
+    level = 0
+    while small.shape[0] > rows:
+        size = (small.shape[1] // 2, small.shape[0] // 2)
+        small = cv2.resize(small, size, dst=pool.get(f'half{level}', (size[1], size[0]) + frame.shape[2:]),
+                           interpolation=cv2.INTER_AREA)
+        level += 1
+    return _upscale(small, frame, pool)
+
+
+def pixelate_linear(frame: np.ndarray, pool: FramePool, block_size: int = PIXELATE_BLOCK) -> np.ndarray:
+    """Implementação original: amostra bilinear de cada bloco (não é a média)"""
+    rows, cols = _pixelate_grid(frame, block_size)
+    small = cv2.resize(frame, (cols, rows), dst=pool.get('small', (rows, cols) + frame.shape[2:]))
+    return _upscale(small, frame, pool)
+
+
+# =====================================
+# Bordas
+# =====================================
+
+def edges_bgr(frame: np.ndarray, pool: FramePool) -> np.ndarray:
+    edges = cv2.Canny(_gray(frame, pool), 100, 200, edges=pool.get('edges', frame.shape[:2]))
+    return cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR, dst=pool.get('filtered', frame.shape[:2] + (3,)))
+
+
+def edges_single(frame: np.ndarray, pool: FramePool) -> np.ndarray:
+    return cv2.Canny(_gray(frame, pool), 100, 200, edges=pool.get('filtered', frame.shape[:2]))
+
+
+# filtro -> modo -> {nome: kernel}; a ordem desempata a sonda
+KERNELS = {
+    'grayscale': {
+        'bgr': {'transform': grayscale_transform, 'cvtcolor': grayscale_cvtcolor},
+        'gray': {'cvtcolor': grayscale_single},
+    },
+    'pixelate': {
+        'bgr': {'halving': pixelate_halving, 'integral': pixelate_integral, 'linear': pixelate_linear},
+    },
+    'edges': {
+        'bgr': {'canny': edges_bgr},
+        'gray': {'canny': edges_single},
+    },
+}
+
+
+# =====================================
+# Sonda
+# =====================================
+
+def _probe_frame() -> np.ndarray:
+    width, height = PROBE_SIZE
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (height, width, 3), np.uint8)
+    cv2.circle(frame, (width // 2, height // 2), height // 3, (0, 200, 255), -1)
+    return frame
+
+
+def _references(frame: np.ndarray) -> dict:
+    """Saída esperada de cada filtro (em 1 canal) e a tolerância por pixel"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    height, width = frame.shape[:2]
+    b = PIXELATE_BLOCK
+    blocks = frame[:height // b * b, :width // b * b].reshape(height // b, b, width // b, b, 3)
+    means = np.rint(blocks.mean(axis=(1, 3))).astype(np.uint8)
+    pixelated = np.repeat(np.repeat(means, b, axis=0), b, axis=1)
+    return {
+        'grayscale': (gray, 1),
+        'pixelate': (pixelated, 2),
+        'edges': (cv2.Canny(gray, 100, 200), 0),
+    }
+
+
+def _max_error(output: np.ndarray, expected: np.ndarray) -> int:
+    if output.shape != expected.shape:
+        if output.ndim == 3 and expected.ndim == 2:
+            # Filtros em cinza: os 3 canais devem ser iguais à referência
+            return max(_max_error(output[..., c], expected) for c in range(3))
+        return 255
+    return int(cv2.norm(output, expected, cv2.NORM_INF))
+
+
+def probe_kernel(kernel, frame: np.ndarray, expected: np.ndarray, tolerance: int) -> dict:
+    pool = FramePool()
+    output = kernel(frame, pool=pool)
+    error = _max_error(output, expected)
+    t0 = time.perf_counter()
+    for _ in range(PROBE_REPEATS):
+        kernel(frame, pool=pool)
+    ms = (time.perf_counter() - t0) / PROBE_REPEATS * 1000
+    return {'ms': round(ms, 3), 'max_error': error, 'ok': error <= tolerance}
+
+
+def select_kernels(force: bool = False) -> dict:
+    """
+    Mede os kernels de cada filtro/modo e escolhe o mais rápido entre os
+    que reproduzem a referência. Roda uma vez por processo (ver create_app).
+    """
+    global _results
+    with _lock:
+        if _results is not None and not force:
+            return _results
+
+        t0 = time.perf_counter()
+        frame = _probe_frame()
+        references = _references(frame)
+        selected, probes = {}, {}
+        for filter_name, modes in KERNELS.items():
+            expected, tolerance = references[filter_name]
+            override = os.getenv(f'KERNEL_{filter_name.upper()}')
+            for mode, candidates in modes.items():
+                key = f'{filter_name}/{mode}'
+                probes[key] = {name: probe_kernel(k, frame, expected, tolerance)
+                               for name, k in candidates.items()}
+                if override in candidates:
+                    selected[key] = override
+                    continue
+                working = [name for name, p in probes[key].items() if p['ok']]
+                # Nenhum passou (não deveria acontecer): fica com o primeiro
+                selected[key] = min(working, key=lambda n: probes[key][n]['ms']) if working \
+                    else next(iter(candidates))
+
+        _results = {
+            'opencv': cv2.__version__,
+            'threads': cv2.getNumThreads(),
+            'single_channel_output': SINGLE_CHANNEL_OUTPUT,
+            'probe_sec': round(time.perf_counter() - t0, 3),
+            'selected': selected,
+            'probes': probes,
+        }
+        print(f"Kernels: {selected}")
+        return _results
+
+
+def single_channel(filter_name: str) -> bool:
+    """True se o filtro pode gravar a saída em 1 canal"""
+    filter_name = _ALIASES.get(filter_name, filter_name)
+    return SINGLE_CHANNEL_OUTPUT and 'gray' in KERNELS.get(filter_name, {})
+
+
+def kernel_for(filter_name: str, mode: str = 'bgr'):
+    """Kernel escolhido pela sonda para o filtro e modo ('bgr' ou 'gray')"""
+    filter_name = _ALIASES.get(filter_name, filter_name)
+    name = select_kernels()['selected'][f'{filter_name}/{mode}']
+    return KERNELS[filter_name][mode][name]
+
+
+def configure_threads(parallel_jobs: int = 1) -> int:
+    """
+    Ajusta as threads internas do OpenCV (cv2.setNumThreads) para que
+    `parallel_jobs` jobs ou processos simultâneos não disputem os mesmos
+    núcleos. OPENCV_THREADS fixa o valor. Retorna o número aplicado.
+    """
+    threads = OPENCV_THREADS or max((os.cpu_count() or 1) // max(parallel_jobs, 1), 1)
+    cv2.setNumThreads(threads)
+    return threads
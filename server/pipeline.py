@@ -0,0 +1,289 @@
+"""
+Pipeline de um upload: original -> processado -> banco.
+
+Cada job tem um job.json no diretório do vídeo registrando em que etapa
+está. Todas as saídas são gravadas em arquivos temporários e renomeadas
+atomicamente, então um job interrompido pode ser retomado da última
+etapa concluída (ver recovery.py) sem deixar arquivos pela metade.
+"""
+import os
+import json
+import shutil
+from pathlib import Path
+from datetime import datetime, timezone
+
+import cv2
+
+from config import VIDEOS, TRASH
+from db import insert_video, get_video, release_idempotency_key
+from encoders import open_writer
+from processing import process_video, SKIP_DIFF_THRESHOLD
+from previews import preview_name
+from utils import now_parts, part_path, remove_stale_parts, write_json_atomic
+
+# Etapas do job, em ordem
+STAGE_RECEIVED = 'received'
+STAGE_ORIGINAL_SAVED = 'original_saved'
+STAGE_PROCESSED = 'processed'
+STAGE_DONE = 'done'
+
+
+# =====================================
+# Caminhos
+# =====================================
+
+def job_paths(base: Path, ext: str, filter_name: str, preview: str | None = None):
+    processed_dir = base / 'processed' / filter_name
+    return {
+        'base': base,
+        'original': base / 'original' / f'video{ext}',
+        'processed': processed_dir / f'video{ext}',
+        'checkpoint': processed_dir / '.checkpoint.json',
+        'thumb_jpg': base / 'thumbs' / 'frame_0001.jpg',
+        # Nome gravado no job.json: mudar PREVIEW_FORMAT não afeta jobs em curso
+        'preview': base / 'thumbs' / (preview or preview_name()),
+        'meta_json': base / 'meta.json',
+        'job_json': base / 'job.json',
+    }
+
+
+def build_paths(video_id: str, ext: str, filter_name: str, base: Path | None = None,
+                preview: str | None = None):
+    if base is None:
+        dt, y, m, d = now_parts()
+        base = VIDEOS / y / m / d / video_id
+    paths = job_paths(base, ext, filter_name, preview)
+    for key in ('original', 'processed', 'thumb_jpg'):
+        paths[key].parent.mkdir(parents=True, exist_ok=True)
+    return paths
+
+
+# =====================================
+# Original
+# =====================================
+
+def write_original(incoming_path: Path, original_path: Path):
+    """
+    Salva o vídeo original garantindo que não seja corrompido.
+    Usa OpenCV para reescrever o vídeo com codec compatível.
+    O upload já foi gravado em incoming_path (ver app.upload_video).
+    """
+    print(f"Salvando vídeo original: {original_path}")
+    
+    try:
+        # Abre o arquivo recebido com OpenCV
+        cap = cv2.VideoCapture(str(incoming_path))
+        if not cap.isOpened():
+            print("Falha ao abrir vídeo recebido, salvando diretamente...")
+            # Fallback: salva diretamente
+            shutil.copyfile(incoming_path, original_path)
+            return
+        
+        # Obter propriedades
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        
+        print(f"Propriedades do original: {width}x{height}, {fps} FPS")
+        
+        # Se não conseguir obter dimensões, usa fallback
+        if width <= 0 or height <= 0:
+            ret, test_frame = cap.read()
+            if ret:
+                height, width = test_frame.shape[:2]
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            else:
+                print("Não foi possível ler frame, usando fallback...")
+                cap.release()
+                shutil.copyfile(incoming_path, original_path)
+                return
+        
+        # Garantir dimensões pares
+        width = width + (width % 2)
+        height = height + (height % 2)
+        
+        # Usar o melhor codec do host para o container do original
+        original_path.parent.mkdir(parents=True, exist_ok=True)
+        out, codec_name = open_writer(original_path, fps, (width, height))
+        
+        # Se nenhum codec funcionar, usa fallback
+        if out is None:
+            print("Falha com todos os codecs, usando fallback...")
+            cap.release()
+            shutil.copyfile(incoming_path, original_path)
+            return
+        print(f"Codec do original: {codec_name}")
+        
+        # Copia todos os frames (decode e resize reutilizam os mesmos buffers)
+        frame_count = 0
+        decoded = None
+        resized = None
+        while True:
+            ret, decoded = cap.read(decoded)
+            if not ret:
+                break
+            
+            # Redimensionar se necessário
+            frame = decoded
+            if frame.shape[:2] != (height, width):
+                resized = cv2.resize(decoded, (width, height), dst=resized)
+                frame = resized
+            
+            out.write(frame)
+            frame_count += 1
+        
+        cap.release()
+        out.release()
+        
+        print(f"Vídeo original salvo com {frame_count} frames")
+        
+        # Verificar se foi criado corretamente
+        if not original_path.exists() or original_path.stat().st_size == 0:
+            print("Falha na reescrita, usando fallback...")
+            shutil.copyfile(incoming_path, original_path)
+    
+    except Exception as e:
+        print(f"Erro ao processar original: {e}, usando fallback...")
+        # Em caso de erro, salva diretamente
+        shutil.copyfile(incoming_path, original_path)
+
+
+def save_original_video_properly(incoming_path: Path, original_path: Path):
+    """Reescreve o original num .part e só então o move para o destino"""
+    remove_stale_parts(original_path)
+    tmp_path = part_path(original_path)
+    write_original(incoming_path, tmp_path)
+    os.replace(tmp_path, original_path)
+
+
+# =====================================
+# Jobs
+# =====================================
+
+def save_job(job: dict):
+    write_json_atomic(Path(job['base']) / 'job.json', job)
+
+
+def load_job(base: Path) -> dict | None:
+    try:
+        with open(base / 'job.json') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def new_job(video_id: str, original_name: str, ext: str, filter_name: str, incoming_path: Path,
+            skip_threshold: float = SKIP_DIFF_THRESHOLD, idempotency_key: str | None = None,
+            start_sec: float | None = None, end_sec: float | None = None,
+            roi: tuple[int, int, int, int] | None = None) -> dict:
+    paths = build_paths(video_id, ext, filter_name)
+    job = {
+        'id': video_id,
+        'original_name': original_name,
+        'ext': ext,
+        'filter': filter_name,
+        'skip_threshold': skip_threshold,
+        'start_sec': start_sec,
+        'end_sec': end_sec,
+        'roi': list(roi) if roi else None,
+        'idempotency_key': idempotency_key,
+        'incoming': str(incoming_path),
+        'base': str(paths['base']),
+        'preview': paths['preview'].name,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'stage': STAGE_RECEIVED,
+    }
+    save_job(job)
+    return job
+
+
+def run_job(job: dict, should_stop=None, ensure_owner=None) -> dict:
+    """
+    Executa (ou retoma) um job a partir da etapa registrada em job.json.
+    Retorna os metadados gravados no banco.
+
+    No modo fila o worker passa should_stop (interrompe o processamento
+    quando o lease é perdido) e ensure_owner, chamado antes de cada
+    gravação do job.json e do banco; lança exceção se o job já for de
+    outro worker.
+    """
+    video_id = job['id']
+    paths = build_paths(video_id, job['ext'], job['filter'], base=Path(job['base']),
+                        preview=job.get('preview'))
+
+    def commit_stage(stage: str):
+        if ensure_owner is not None:
+            ensure_owner()
+        job['stage'] = stage
+        save_job(job)
+
+    if job['stage'] == STAGE_RECEIVED:
+        # Salva o original de forma segura
+        save_original_video_properly(Path(job['incoming']), paths["original"])
+
+        # Verifica se o original foi salvo
+        if not paths["original"].exists():
+            raise RuntimeError("Falha ao salvar vídeo original")
+
+        print(f"Original salvo: {paths['original']} ({paths['original'].stat().st_size} bytes)")
+        commit_stage(STAGE_ORIGINAL_SAVED)
+        Path(job['incoming']).unlink(missing_ok=True)
+
+    if job['stage'] == STAGE_ORIGINAL_SAVED:
+        # Processa vídeo (aplicando filtro); retoma do checkpoint se houver
+        result = process_video(
+            paths["original"],
+            paths["processed"],
+            job['filter'],
+            paths["thumb_jpg"],
+            paths["preview"],
+            skip_threshold=job['skip_threshold'],
+            checkpoint=paths["checkpoint"],
+            start_sec=job.get('start_sec'),
+            end_sec=job.get('end_sec'),
+            roi=tuple(job['roi']) if job.get('roi') else None,
+            should_stop=should_stop,
+            ensure_owner=ensure_owner,
+        )
+        print(f"Vídeo processado: {paths['processed']} ({paths['processed'].stat().st_size} bytes)")
+        job['result'] = result
+        commit_stage(STAGE_PROCESSED)
+
+    # Metadados
+    meta = {
+        "id": video_id,
+        "original_name": job['original_name'],
+        "ext": job['ext'],
+        "filter": job['filter'],
+        "created_at": job['created_at'],
+        "path_original": str(paths["original"]),
+        "path_processed": str(paths["processed"]),
+        # O preview é opcional (falha ao gerar não derruba o job)
+        "preview_file": paths["preview"].name if paths["preview"].exists() else None,
+        **job['result']  # Adiciona fps, width, height, etc.
+    }
+
+    if job['stage'] != STAGE_DONE:
+        if ensure_owner is not None:
+            ensure_owner()
+        # Uma entrega anterior pode ter inserido a linha e morrido antes do job.json
+        if get_video(video_id) is None:
+            insert_video(meta)
+        commit_stage(STAGE_DONE)
+    return meta
+
+
+def discard_job(base: Path, job: dict | None = None):
+    """Move o diretório de um job que não pode ser concluído para a trash"""
+    if job and job.get('idempotency_key'):
+        release_idempotency_key(job['idempotency_key'])
+    if job:
+        Path(job['incoming']).unlink(missing_ok=True)
+    if not base.exists():
+        return
+    trash_path = TRASH / base.name
+    if trash_path.exists():
+        shutil.rmtree(trash_path)
+    trash_path.parent.mkdir(parents=True, exist_ok=True)
+    base.rename(trash_path)
+    print(f"Job {base.name} descartado: {trash_path}")
@@ -0,0 +1,163 @@
+import os
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from encoders import open_writer
+from utils import part_path
+
+# Formato do preview animado: webp (padrão), mp4 (loop curto) ou gif (legado)
+PREVIEW_FORMAT = os.getenv('PREVIEW_FORMAT', 'webp').lower()
+PREVIEW_WIDTH = int(os.getenv('PREVIEW_WIDTH', '320'))
+PREVIEW_MAX_FRAMES = int(os.getenv('PREVIEW_MAX_FRAMES', '24'))
+# Orçamento por preview; a qualidade, o número de frames e a largura
+# caem até caber
+PREVIEW_MAX_BYTES = int(os.getenv('PREVIEW_MAX_BYTES', str(300 * 1024)))
+# Mudança média (0-255) em relação ao último frame escolhido que
+# conta como nova cena
+PREVIEW_SCENE_THRESHOLD = float(os.getenv('PREVIEW_SCENE_THRESHOLD', '10'))
+PREVIEW_FRAME_MS = 400
+PREVIEW_QUALITY = 75
+
+# Quantas vezes por segundo de vídeo a detecção de cena olha um frame
+CHECKS_PER_SEC = 4
+SIGNATURE_WIDTH = 64
+
+
+def preview_name(fmt: str = PREVIEW_FORMAT) -> str:
+    return f'preview.{fmt}'
+
+
+class PreviewCollector:
+    """
+    Escolhe os frames do preview por mudança de cena, em vez de passo fixo.
+
+    Algumas vezes por segundo compara uma assinatura reduzida do frame com
+    a do último frame escolhido; acima de PREVIEW_SCENE_THRESHOLD o frame
+    entra no preview (já reduzido a PREVIEW_WIDTH). O primeiro frame sempre
+    entra, e trechos sem corte ganham um frame a cada max_gap frames para
+    que movimentos lentos também apareçam.
+    Se passar de max_frames, metade dos escolhidos é descartada (um sim,
+    um não) e a distância mínima entre frames dobra, então a memória fica
+    limitada e o preview cobre o vídeo todo.
+    """
+
+    def __init__(self, fps: float, total_frames: int = 0, width: int = PREVIEW_WIDTH,
+                 max_frames: int = PREVIEW_MAX_FRAMES, threshold: float = PREVIEW_SCENE_THRESHOLD):
+        self.check_every = max(int(fps // CHECKS_PER_SEC), 1)
+        self.width = width
+        self.max_frames = max(max_frames, 1)
+        self.threshold = threshold
+        self.min_gap = self.check_every
+        # Sem frame_count conhecido, um frame a cada 2 s no máximo
+        self.max_gap = max(total_frames // self.max_frames if total_frames else int(fps * 2),
+                           self.check_every)
+        self.frames = []
+        self.indices = []
+        self._reference = None
+
+    def _signature(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        size = (SIGNATURE_WIDTH, max(SIGNATURE_WIDTH * height // width, 1))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return small if small.ndim == 2 else cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def add(self, frame: np.ndarray, index: int):
+        if index % self.check_every:
+            return
+        if self.indices and index - self.indices[-1] < self.min_gap:
+            return
+
+        signature = self._signature(frame)
+        if self._reference is not None and index - self.indices[-1] < self.max_gap:
+            change = cv2.norm(signature, self._reference, cv2.NORM_L1) / signature.size
+            if change < self.threshold:
+                return
+        self._reference = signature
+
+        height, width = frame.shape[:2]
+        size = (self.width, max(self.width * height // width, 1) // 2 * 2)
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        # Saída de 1 canal (filtros em cinza): os encoders do preview esperam BGR
+        self.frames.append(small if small.ndim == 3 else cv2.cvtColor(small, cv2.COLOR_GRAY2BGR))
+        self.indices.append(index)
+
+        if len(self.frames) > self.max_frames:
+            self.frames = self.frames[::2]
+            self.indices = self.indices[::2]
+            self.min_gap *= 2
+
+
+def _scaled(frames: list[np.ndarray], scale: float) -> list[np.ndarray]:
+    height, width = frames[0].shape[:2]
+    size = (max(int(width * scale) // 2 * 2, 2), max(int(height * scale) // 2 * 2, 2))
+    return [cv2.resize(f, size, interpolation=cv2.INTER_AREA) for f in frames]
+
+
+def _encode(frames: list[np.ndarray], path: Path, fmt: str, quality: int):
+    if fmt == 'mp4':
+        height, width = frames[0].shape[:2]
+        out, _ = open_writer(path, 1000 / PREVIEW_FRAME_MS, (width, height))
+        if out is None:
+            raise RuntimeError("Nenhum codec disponível para o preview mp4")
+        for frame in frames:
+            out.write(frame)
+        out.release()
+        return
+
+    from PIL import Image
+
+    images = [Image.fromarray(cv2.cvtColor(f, cv2.COLOR_BGR2RGB)) for f in frames]
+    options = {'save_all': True, 'append_images': images[1:], 'duration': PREVIEW_FRAME_MS, 'loop': 0}
+    if fmt == 'webp':
+        options.update(quality=quality, method=4)
+    else:
+        options.update(optimize=True)
+    images[0].save(path, format=fmt.upper(), **options)
+
+
+def write_preview(frames: list[np.ndarray], path: Path, max_bytes: int = PREVIEW_MAX_BYTES) -> dict:
+    """
+    Grava o preview animado (formato pela extensão de `path`) dentro do
+    orçamento de bytes: primeiro reduz a qualidade (só webp), depois
+    descarta metade dos frames e por fim reduz a largura.
+    """
+    fmt = path.suffix.lstrip('.').lower()
+    if fmt not in ('webp', 'mp4', 'gif'):
+        raise ValueError(f"Formato de preview não suportado: {fmt}")
+
+    t0 = time.perf_counter()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = part_path(path)
+    quality = PREVIEW_QUALITY
+    attempts = 0
+    while True:
+        attempts += 1
+        _encode(frames, tmp, fmt, quality)
+        size = tmp.stat().st_size
+        if size <= max_bytes:
+            break
+        if fmt == 'webp' and quality > 30:
+            quality -= 15
+        elif len(frames) > 4:
+            frames = frames[::2]
+        elif frames[0].shape[1] > 64:
+            frames = _scaled(frames, 0.75)
+        else:
+            # Não dá para reduzir mais: fica acima do orçamento
+            break
+    os.replace(tmp, path)
+
+    height, width = frames[0].shape[:2]
+    return {
+        'format': fmt,
+        'frames': len(frames),
+        'width': width,
+        'height': height,
+        'bytes': size,
+        'quality': quality if fmt == 'webp' else None,
+        'attempts': attempts,
+        'sec': round(time.perf_counter() - t0, 3),
+    }
@@ -1,20 +1,72 @@
+import os
+import json
+import queue
+import shutil
+import threading
+import multiprocessing
 from pathlib import Path
 import cv2
 import numpy as np
 
-def apply_grayscale(frame: np.ndarray) -> np.ndarray:
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+from buffers import FramePool
+from config import DEBUG
+from encoders import encoder_ranking, open_writer
+from frame_ring import FrameRing
+from kernels import kernel_for, single_channel, configure_threads
+from previews import PreviewCollector, write_preview
+from utils import part_path, is_part, part_is_stale, remove_stale_parts, write_json_atomic
 
-def apply_pixelate(frame: np.ndarray, block_size: int = 16) -> np.ndarray:
+# Diferença média (0-255) abaixo da qual um frame é considerado estático.
+# 0 desliga o modo e mantém a saída idêntica ao processamento completo.
+SKIP_DIFF_THRESHOLD = float(os.getenv('SKIP_DIFF_THRESHOLD', '0'))
+# Largura da versão reduzida usada para comparar frames
+DIFF_WIDTH = 64
+
+# Vídeos longos podem ser gravados em segmentos de N frames; cada segmento
+# concluído vira um checkpoint e um job interrompido retoma dali. 0 desliga.
+SEGMENT_FRAMES = int(os.getenv('SEGMENT_FRAMES', '0'))
+
+# Processos de filtro por job (0 = tudo na thread do upload). Os frames
+# trafegam por um FrameRing em memória compartilhada; só índices passam
+# pelas filas.
+PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', '0'))
+# Slots do anel por worker (um sendo filtrado, outro esperando na fila),
+# mais dois para o decodificador e o codificador
+RING_SLOTS_PER_WORKER = 2
+
+# Os filtros aceitam um FramePool opcional: com ele, intermediários e
+# saída são escritos em buffers reutilizados (a saída só é válida até
+# a próxima chamada com o mesmo pool).
+# São a referência dos filtros; o pipeline usa as implementações que
+# kernels.select_kernels escolhe para o host (ver bench.py kernels).
+
+def apply_grayscale(frame: np.ndarray, pool: FramePool | None = None) -> np.ndarray:
+    if pool is None:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
     height, width = frame.shape[:2]
-    small = cv2.resize(frame, (width // block_size, height // block_size))
-    return cv2.resize(small, (width, height), interpolation=cv2.INTER_NEAREST)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=pool.get('gray', (height, width)))
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=pool.get('filtered', frame.shape))
 
-def apply_edges(frame: np.ndarray) -> np.ndarray:
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    edges = cv2.Canny(gray, 100, 200)
-    return cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
+def apply_pixelate(frame: np.ndarray, block_size: int = 16, pool: FramePool | None = None) -> np.ndarray:
+    height, width = frame.shape[:2]
+    small_size = (max(width // block_size, 1), max(height // block_size, 1))
+    if pool is None:
+        small = cv2.resize(frame, small_size)
+        return cv2.resize(small, (width, height), interpolation=cv2.INTER_NEAREST)
+    small = cv2.resize(frame, small_size, dst=pool.get('small', (small_size[1], small_size[0], 3)))
+    return cv2.resize(small, (width, height), dst=pool.get('filtered', frame.shape),
+                      interpolation=cv2.INTER_NEAREST)
+
+def apply_edges(frame: np.ndarray, pool: FramePool | None = None) -> np.ndarray:
+    if pool is None:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(gray, 100, 200)
+        return cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
+    height, width = frame.shape[:2]
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=pool.get('gray', (height, width)))
+    edges = cv2.Canny(gray, 100, 200, edges=pool.get('edges', (height, width)))
+    return cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR, dst=pool.get('filtered', frame.shape))
 
 FILTERS = {
     'grayscale': apply_grayscale,
@@ -23,20 +75,531 @@ FILTERS = {
     'edges': apply_edges,
 }
 
-def get_best_codec():
-    """Retorna o melhor codec disponível no sistema"""
-    # Tenta diferentes codecs em ordem de preferência
-    codecs = [
-        ('avc1', cv2.VideoWriter_fourcc(*'avc1')),  # H.264 (melhor compatibilidade)
-        ('mp4v', cv2.VideoWriter_fourcc(*'mp4v')),  # MPEG-4
-        ('XVID', cv2.VideoWriter_fourcc(*'XVID')),  # Xvid
-        ('MJPG', cv2.VideoWriter_fourcc(*'MJPG')),  # Motion JPEG (fallback)
+def get_best_codec(ext: str = '.mp4'):
+    """Retorna o melhor codec do host para o container (ver encoders.probe_encoders)"""
+    codec_name = encoder_ranking(ext)[0]
+    return cv2.VideoWriter_fourcc(*codec_name), codec_name
+
+def frame_signature(frame: np.ndarray, size: tuple[int, int], pool: FramePool | None = None) -> np.ndarray:
+    """Versão reduzida em cinza do frame, barata de comparar"""
+    if pool is None:
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(frame, size, dst=pool.get('signature_bgr', (size[1], size[0], 3)),
+                       interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=pool.get('signature', (size[1], size[0])))
+
+def frame_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """Diferença absoluta média entre duas assinaturas (0-255)"""
+    return cv2.norm(a, b, cv2.NORM_L1) / a.size
+
+def clip_bounds(info: dict, start_sec: float | None = None, end_sec: float | None = None,
+                roi: tuple[int, int, int, int] | None = None):
+    """
+    Converte o intervalo de tempo em frames [start, end) e valida a região
+    de interesse (x, y, w, h) contra as dimensões do vídeo.
+    Lança ValueError para parâmetros inválidos.
+    """
+    fps = info['fps']
+    total = info.get('frame_count') or 0
+
+    start_frame = int(round(start_sec * fps)) if start_sec else 0
+    end_frame = int(round(end_sec * fps)) if end_sec is not None else None
+    if start_frame < 0 or (end_sec is not None and end_sec < 0):
+        raise ValueError("Tempos não podem ser negativos")
+    if total and start_frame >= total:
+        raise ValueError("Início além do fim do vídeo")
+    if end_frame is not None:
+        if end_frame <= start_frame:
+            raise ValueError("Fim deve ser maior que o início")
+        if total:
+            end_frame = min(end_frame, total)
+
+    if roi is not None:
+        x, y, w, h = roi
+        if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > info['width'] or y + h > info['height']:
+            raise ValueError(f"Região {roi} fora do quadro {info['width']}x{info['height']}")
+        if (x, y, w, h) == (0, 0, info['width'], info['height']):
+            roi = None
+
+    return start_frame, end_frame, roi
+
+def probe_video(src_path: Path) -> dict:
+    """Lê apenas as propriedades do vídeo (sem decodificar o conteúdo)"""
+    cap = cv2.VideoCapture(str(src_path))
+    if not cap.isOpened():
+        raise RuntimeError("Não foi possível abrir o vídeo de entrada")
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    if width <= 0 or height <= 0:
+        ret, test_frame = cap.read()
+        if not ret:
+            cap.release()
+            raise RuntimeError("Não foi possível determinar dimensões do vídeo")
+        height, width = test_frame.shape[:2]
+    cap.release()
+
+    if fps <= 0:
+        fps = 25.0
+
+    return {
+        'fps': float(fps),
+        'width': width,
+        'height': height,
+        'frame_count': max(frame_count, 0),
+    }
+
+class JobCancelled(RuntimeError):
+    """O job foi interrompido de fora (ex.: o worker perdeu o lease da fila)"""
+
+
+def _always_owner():
+    pass
+
+
+class AtomicVideoWriter:
+    """
+    Grava o vídeo num arquivo .part e só o renomeia para o destino no final.
+    ensure_owner() é chamada antes de tocar no destino e lança exceção se o
+    job já for de outro processo (ver worker.py).
+    """
+
+    def __init__(self, dst_path: Path, fps: float, size: tuple[int, int], is_color: bool = True,
+                 ensure_owner=None):
+        self.dst_path = dst_path
+        self.ensure_owner = ensure_owner or _always_owner
+        remove_stale_parts(dst_path)
+        self.tmp_path = part_path(dst_path)
+        self.frames_done = 0
+        self.stats = {}
+        self.out, self.codec = open_writer(self.tmp_path, fps, size, is_color)
+        if self.out is None and not is_color:
+            # Nenhum codec aceitou entrada em 1 canal: grava em BGR
+            is_color = True
+            self.out, self.codec = open_writer(self.tmp_path, fps, size)
+        if self.out is None:
+            raise RuntimeError("Não foi possível criar o vídeo de saída com nenhum codec")
+        self.is_color = is_color
+
+    def write(self, frame: np.ndarray):
+        self.out.write(frame)
+
+    def finish(self):
+        self.out.release()
+        if not (self.tmp_path.exists() and self.tmp_path.stat().st_size > 0):
+            self.tmp_path.unlink(missing_ok=True)
+            raise RuntimeError("Vídeo não foi criado corretamente!")
+        try:
+            self.ensure_owner()
+        except Exception:
+            self.tmp_path.unlink(missing_ok=True)
+            raise
+        os.replace(self.tmp_path, self.dst_path)
+
+    def abort(self):
+        """Descarta o vídeo parcial sem tocar no destino"""
+        self.out.release()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class SegmentedVideoWriter:
+    """
+    Grava o vídeo em segmentos de `segment_frames` frames em .segments/.
+    Ao fechar cada segmento (renomeado atomicamente) o checkpoint registra
+    quantos frames já estão garantidos em disco; um job interrompido
+    recomeça do primeiro frame após o último segmento completo.
+    No final os pacotes já codificados dos segmentos são copiados para o
+    destino sem recodificar (ver _concat_stream_copy); só se a cópia falhar
+    os segmentos são decodificados e gravados de novo.
+
+    O diretório e o checkpoint são compartilhados entre as entregas de um
+    job: ensure_owner() é chamada antes de registrar um segmento, gravar o
+    checkpoint ou montar/apagar qualquer coisa em finish(), para que um
+    worker que perdeu o lease não sobrescreva o trabalho do novo dono.
+    """
+
+    def __init__(self, dst_path: Path, fps: float, size: tuple[int, int],
+                 segment_frames: int, checkpoint_path: Path, is_color: bool = True,
+                 ensure_owner=None):
+        self.dst_path = dst_path
+        self.ensure_owner = ensure_owner or _always_owner
+        self.fps = fps
+        self.size = size
+        self.is_color = is_color
+        self.segment_frames = segment_frames
+        self.checkpoint_path = checkpoint_path
+        self.segments_dir = dst_path.parent / '.segments'
+        self.segments_dir.mkdir(parents=True, exist_ok=True)
+
+        state = {'segments': [], 'frames_done': 0, 'stats': {}}
+        if checkpoint_path.exists():
+            with open(checkpoint_path) as f:
+                state = json.load(f)
+        # Descarta segmentos que não chegaram a ser registrados; temporários
+        # só se o processo que os grava não existir mais
+        for seg in self.segments_dir.iterdir():
+            if is_part(seg) and not part_is_stale(seg):
+                continue
+            if seg.name not in state['segments']:
+                seg.unlink(missing_ok=True)
+        self.segments = state['segments']
+        self.frames_done = state['frames_done']
+        self.stats = state['stats']
+
+        self.out = None
+        self.codec = state.get('codec')
+        self.tmp_path = None
+        self.current_frames = 0
+
+    def _segment_path(self, index: int) -> Path:
+        return self.segments_dir / f'seg_{index:05d}{self.dst_path.suffix}'
+
+    def _open_segment(self):
+        self.tmp_path = part_path(self._segment_path(len(self.segments)))
+        self.out, self.codec = open_writer(self.tmp_path, self.fps, self.size, self.is_color)
+        if self.out is None and not self.is_color:
+            # Nenhum codec aceitou entrada em 1 canal: os próximos frames
+            # são convertidos para BGR em write()
+            self.is_color = True
+            self.out, self.codec = open_writer(self.tmp_path, self.fps, self.size)
+        if self.out is None:
+            raise RuntimeError("Não foi possível criar o vídeo de saída com nenhum codec")
+        self.current_frames = 0
+
+    def _close_segment(self):
+        self.out.release()
+        self.out = None
+        path = self._segment_path(len(self.segments))
+        try:
+            self.ensure_owner()
+        except Exception:
+            self.tmp_path.unlink(missing_ok=True)
+            raise
+        os.replace(self.tmp_path, path)
+        self.segments.append(path.name)
+        self.frames_done += self.current_frames
+        write_json_atomic(self.checkpoint_path, {
+            'segments': self.segments,
+            'frames_done': self.frames_done,
+            'stats': self.stats,
+            'codec': self.codec,
+        })
+
+    def write(self, frame: np.ndarray):
+        if self.out is None:
+            self._open_segment()
+        if self.is_color and frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        self.out.write(frame)
+        self.current_frames += 1
+        if self.current_frames >= self.segment_frames:
+            self._close_segment()
+
+    def abort(self):
+        """
+        Descarta o segmento em andamento; os já registrados no checkpoint
+        ficam para quem retomar o job
+        """
+        if self.out is not None:
+            self.out.release()
+            self.out = None
+            self.tmp_path.unlink(missing_ok=True)
+
+    def frames(self):
+        """Decodifica os segmentos já registrados: gera (frame, índice)"""
+        index = 0
+        frame = None
+        for name in self.segments:
+            cap = cv2.VideoCapture(str(self.segments_dir / name))
+            while True:
+                ret, frame = cap.read(frame)
+                if not ret:
+                    break
+                yield frame, index
+                index += 1
+            cap.release()
+
+    def _concat_reencode(self, tmp_path: Path):
+        out, self.codec = open_writer(tmp_path, self.fps, self.size)
+        if out is None:
+            raise RuntimeError("Não foi possível criar o vídeo de saída com nenhum codec")
+        for frame, _ in self.frames():
+            out.write(frame)
+        out.release()
+
+    def finish(self):
+        """Junta os segmentos no destino"""
+        if self.out is not None:
+            self._close_segment()
+        if not self.segments:
+            raise RuntimeError("Vídeo não foi criado corretamente!")
+
+        remove_stale_parts(self.dst_path)
+        tmp_path = part_path(self.dst_path)
+        segments = [self.segments_dir / name for name in self.segments]
+        if not _concat_stream_copy(segments, tmp_path, self.fps, self.size, self.frames_done):
+            print("Cópia direta dos segmentos falhou; recodificando")
+            self._concat_reencode(tmp_path)
+
+        try:
+            self.ensure_owner()
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        os.replace(tmp_path, self.dst_path)
+        shutil.rmtree(self.segments_dir, ignore_errors=True)
+        self.checkpoint_path.unlink(missing_ok=True)
+
+
+def _concat_stream_copy(segments: list[Path], dst_path: Path, fps: float, size: tuple[int, int],
+                        expected_frames: int) -> bool:
+    """
+    Concatena os segmentos copiando os pacotes codificados (modo raw do
+    backend FFmpeg do OpenCV), sem decodificar nem recodificar. Cada
+    segmento começa num keyframe, porque saiu de um encoder novo; os
+    parâmetros do codec (extradata) vão junto do primeiro pacote.
+    Retorna False se os segmentos não permitirem a cópia (codecs
+    diferentes, backend sem suporte), deixando o chamador recodificar.
+    """
+    if not hasattr(cv2, 'VIDEOWRITER_PROP_RAW_VIDEO'):
+        return False
+
+    out = None
+    fourcc = None
+    written = 0
+    try:
+        for path in segments:
+            cap = cv2.VideoCapture(str(path), cv2.CAP_FFMPEG)
+            try:
+                if not cap.isOpened() or not cap.set(cv2.CAP_PROP_FORMAT, -1):
+                    return False
+                segment_fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+                if out is None:
+                    fourcc = segment_fourcc
+                    out = cv2.VideoWriter(str(dst_path), cv2.CAP_FFMPEG, fourcc, fps, size,
+                                          [cv2.VIDEOWRITER_PROP_RAW_VIDEO, 1])
+                    if not out.isOpened():
+                        return False
+                elif segment_fourcc != fourcc:
+                    return False
+
+                while True:
+                    ret, packet = cap.read()
+                    if not ret:
+                        break
+                    if written == 0:
+                        ret, extradata = cap.retrieve(None, int(cap.get(cv2.CAP_PROP_CODEC_EXTRADATA_INDEX)))
+                        if ret and extradata is not None and extradata.size:
+                            packet = np.concatenate([extradata.reshape(1, -1), packet.reshape(1, -1)], axis=1)
+                    out.set(cv2.VIDEOWRITER_PROP_KEY_FLAG, 1 if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) else 0)
+                    out.write(packet)
+                    written += 1
+            finally:
+                cap.release()
+    finally:
+        if out is not None:
+            out.release()
+
+    if written != expected_frames:
+        return False
+    # Confere se o resultado decodifica
+    cap = cv2.VideoCapture(str(dst_path))
+    readable = cap.isOpened() and cap.read()[0]
+    cap.release()
+    return readable
+
+
+def _roi_view(frame: np.ndarray, roi: tuple[int, int, int, int] | None) -> np.ndarray:
+    if roi is None:
+        return frame
+    x, y, w, h = roi
+    return frame[y:y + h, x:x + w]
+
+
+def _filter_slot(ring: FrameRing, slot: int, filter_fn, roi, pool: FramePool):
+    target = _roi_view(ring.view(slot), roi)
+    filtered = filter_fn(target, pool=pool)
+    if filtered.shape[:2] != target.shape[:2]:
+        filtered = cv2.resize(filtered, (target.shape[1], target.shape[0]))
+    target[...] = filtered
+
+
+def _filter_worker(ring_spec: tuple, filter_fn, roi, workers: int, tasks, done):
+    """
+    Processo de filtro: recebe (índice, slot), filtra o slot no lugar e
+    devolve. filter_fn é o kernel já escolhido pelo processo principal
+    (funções de módulo passam pelo pickle do spawn por nome).
+    """
+    # Os núcleos já são divididos entre os workers
+    configure_threads(workers)
+    ring = FrameRing.attach(*ring_spec)
+    pool = FramePool()
+    try:
+        while (task := tasks.get()) is not None:
+            index, slot = task
+            try:
+                _filter_slot(ring, slot, filter_fn, roi, pool)
+                done.put((index, slot, False, None))
+            except Exception as e:
+                done.put((index, slot, False, str(e)))
+    finally:
+        ring.close()
+
+
+def _process_frames_multiprocess(cap, writer, filter_name: str, workers: int, first_index: int,
+                                 clip_frames: int | None, decoded_shape: tuple, frame_shape: tuple,
+                                 roi, skip_threshold: float, diff_size: tuple, pool: FramePool,
+                                 on_frame, on_progress, should_stop=None):
+    """
+    Variante multiprocesso do laço de process_video.
+
+    A thread principal decodifica direto num slot livre do FrameRing e
+    decide o reaproveitamento de frames estáticos; `workers` processos
+    filtram os slots no lugar; uma thread de codificação grava os slots na
+    ordem original e os devolve à lista de livres.
+    Retorna (frames gravados nesta execução, total de reaproveitados).
+    """
+    # spawn: o servidor tem threads, e fork a partir delas não é seguro
+    ctx = multiprocessing.get_context('spawn')
+    ring = FrameRing(frame_shape, workers * RING_SLOTS_PER_WORKER + 2)
+    free = queue.Queue()
+    for slot in range(ring.slots):
+        free.put(slot)
+    tasks, done = ctx.Queue(), ctx.Queue()
+    procs = [
+        ctx.Process(target=_filter_worker, args=(ring.spec(), kernel_for(filter_name), roi, workers, tasks, done), daemon=True)
+        for _ in range(workers)
     ]
-    
-    # Para teste rápido, vamos usar sempre avc1/H.264 primeiro
-    return codecs[0][1], codecs[0][0]
+    for proc in procs:
+        proc.start()
+
+    stop = threading.Event()
+    skip_enabled = skip_threshold > 0
+    state = {'written': 0, 'skipped': writer.stats.get('skipped_frames', 0), 'error': None}
+
+    def fail(message: str):
+        if state['error'] is None:
+            state['error'] = message
+        stop.set()
+
+    def encode():
+        # Workers terminam fora de ordem: guarda os slots até chegar a vez
+        pending = {}
+        next_index = first_index
+        total = None
+        last_output = None
+        while total is None or next_index < total:
+            try:
+                index, slot, skipped, error = done.get(timeout=1.0)
+            except queue.Empty:
+                if not all(proc.is_alive() for proc in procs):
+                    fail("Worker de filtro terminou inesperadamente")
+                    return
+                continue
+            if index is None:
+                total = slot
+                continue
+            pending[index] = (slot, skipped, error)
+
+            while next_index in pending:
+                slot, skipped, error = pending.pop(next_index)
+                if error is not None:
+                    fail(f"Erro ao processar frame {next_index}: {error}")
+                if state['error'] is None:
+                    try:
+                        frame = ring.view(slot)
+                        target = _roi_view(frame, roi)
+                        if skipped:
+                            # Frame praticamente igual: repete a última saída filtrada
+                            target[...] = last_output
+                            state['skipped'] += 1
+                        elif skip_enabled:
+                            last_output = target.copy()
+                        writer.stats['skipped_frames'] = state['skipped']
+                        writer.write(frame)
+                        state['written'] += 1
+                        if on_frame is not None:
+                            on_frame(frame, next_index)
+                        on_progress(next_index + 1)
+                    except Exception as e:
+                        fail(f"Erro ao gravar frame {next_index}: {e}")
+                free.put(slot)
+                next_index += 1
+
+    def decode():
+        height, width = frame_shape[:2]
+        reference = None
+        i = first_index
+        try:
+            while not stop.is_set() and (clip_frames is None or i < clip_frames):
+                if should_stop is not None and should_stop():
+                    break
+                try:
+                    slot = free.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                frame = ring.view(slot)
+
+                # Decodifica direto no slot compartilhado quando as dimensões batem
+                buffer = frame if decoded_shape == frame_shape else pool.get('decoded', decoded_shape)
+                ret, decoded = cap.read(buffer)
+                if not ret:
+                    free.put(slot)
+                    break
+                if decoded is not frame:
+                    cv2.resize(decoded, (width, height), dst=frame)
+
+                if skip_enabled:
+                    signature = frame_signature(_roi_view(frame, roi), diff_size, pool)
+                    if reference is not None and frame_difference(signature, reference) < skip_threshold:
+                        done.put((i, slot, True, None))
+                        i += 1
+                        continue
+                    reference = pool.get('reference', signature.shape)
+                    np.copyto(reference, signature)
 
-def process_video(src_path: Path, dst_path: Path, filter_name: str, thumb_jpg: Path, preview_gif: Path | None = None):
+                tasks.put((i, slot))
+                i += 1
+        except Exception as e:
+            fail(f"Erro ao decodificar frame {i}: {e}")
+        finally:
+            # Marca de fim: o codificador espera até o índice i
+            done.put((None, i, False, None))
+
+    encoder = threading.Thread(target=encode, name='encoder', daemon=True)
+    encoder.start()
+    try:
+        decode()
+        encoder.join()
+    finally:
+        for _ in procs:
+            tasks.put(None)
+        for proc in procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        ring.close()
+
+    if state['error'] is not None:
+        print(state['error'])
+    return state['written'], state['skipped']
+
+
+def process_video(src_path: Path, dst_path: Path, filter_name: str, thumb_jpg: Path, preview: Path | None = None,
+                  skip_threshold: float = SKIP_DIFF_THRESHOLD, pool: FramePool | None = None,
+                  checkpoint: Path | None = None, segment_frames: int = SEGMENT_FRAMES,
+                  start_sec: float | None = None, end_sec: float | None = None,
+                  roi: tuple[int, int, int, int] | None = None, workers: int = PIPELINE_WORKERS,
+                  should_stop=None, ensure_owner=None):
+    """
+    should_stop(), se dado, é consultado a cada frame; quando devolve True
+    o vídeo parcial é descartado e JobCancelled é lançada. ensure_owner()
+    vai para o writer, que a chama antes de cada gravação compartilhada.
+    """
     if filter_name not in FILTERS:
         raise ValueError(f"Filtro inválido: {filter_name}")
 
@@ -46,6 +609,9 @@ def process_video(src_path: Path, dst_path: Path, filter_name: str, thumb_jpg: P
     if not cap.isOpened():
         raise RuntimeError("Não foi possível abrir o vídeo de entrada")
 
+    if pool is None:
+        pool = FramePool()
+
     # Obter propriedades do vídeo original
     fps = cap.get(cv2.CAP_PROP_FPS)
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -64,102 +630,193 @@ def process_video(src_path: Path, dst_path: Path, filter_name: str, thumb_jpg: P
         else:
             raise RuntimeError("Não foi possível determinar dimensões do vídeo")
     
+    # Dimensões decodificadas (antes do ajuste para pares)
+    decoded_shape = (height, width, 3)
+
+    # Trecho e região a processar (sempre relativos ao vídeo decodificado)
+    start_frame, end_frame, roi = clip_bounds(
+        {'fps': fps, 'width': width, 'height': height, 'frame_count': frame_count},
+        start_sec, end_sec, roi,
+    )
+
     # Garantir que dimensões são pares (necessário para alguns codecs)
     width = width + (width % 2)
     height = height + (height % 2)
     
-    # Tentar diferentes codecs
-    fourcc, codec_name = get_best_codec()
-    
     dst_path.parent.mkdir(parents=True, exist_ok=True)
     
-    # Tentar criar o VideoWriter
-    out = cv2.VideoWriter(str(dst_path), fourcc, fps, (width, height))
-    
-    if not out.isOpened():
-        # Fallback: tentar com MJPG
-        fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-        out = cv2.VideoWriter(str(dst_path), fourcc, fps, (width, height))
-        
-        if not out.isOpened():
-            raise RuntimeError("Não foi possível criar o vídeo de saída com nenhum codec")
+    # Filtros em cinza gravam 1 canal direto no encoder; com ROI o resto
+    # do frame continua colorido e no modo multiprocesso os slots do anel
+    # são BGR, então esses casos seguem em 3 canais
+    gray_output = single_channel(filter_name) and roi is None and workers <= 0
+
+    # Codec escolhido pela sonda de inicialização, com fallback pelo ranking.
+    # Nada aparece em dst_path antes do vídeo estar completo.
+    if segment_frames > 0 and checkpoint is not None:
+        writer = SegmentedVideoWriter(dst_path, fps, (width, height), segment_frames, checkpoint,
+                                      is_color=not gray_output, ensure_owner=ensure_owner)
+    else:
+        writer = AtomicVideoWriter(dst_path, fps, (width, height), is_color=not gray_output,
+                                   ensure_owner=ensure_owner)
+        gray_output = not writer.is_color
+
+    filter_fn = kernel_for(filter_name, 'gray' if gray_output else 'bgr')
+
+    # Preview animado: frames escolhidos por mudança de cena (ver previews.py)
+    preview_frames = None
+    if preview is not None:
+        clip_total = (end_frame - start_frame) if end_frame is not None else frame_count
+        preview_frames = PreviewCollector(fps, clip_total)
 
-    filter_fn = FILTERS[filter_name]
+    def collect_preview(processed: np.ndarray, index: int):
+        # Salvar thumbnail do primeiro frame processado
+        if index == 0:
+            tmp_thumb = part_path(thumb_jpg)
+            cv2.imwrite(str(tmp_thumb), processed)
+            os.replace(tmp_thumb, thumb_jpg)
 
-    # Para GIF de preview
-    frames_for_gif = []
-    sample_every = max(int(fps // 2), 1)  # ~2 fps no GIF
+        if preview_frames is not None:
+            preview_frames.add(processed, index)
 
-    i = 0
-    saved_thumb = False
-    processed_frames = 0
+    # Busca direto o primeiro frame do trecho (sem decodificar desde o 0);
+    # na retomada, pula também os frames já garantidos pelo checkpoint
+    i = writer.frames_done
+    if i > 0:
+        print(f"Retomando do checkpoint: frame {i}/{frame_count}")
+        if preview_frames is not None:
+            # O preview precisa também dos frames gravados antes da interrupção
+            for frame, index in writer.frames():
+                preview_frames.add(frame, index)
+    if start_frame + i > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame + i)
+    processed_frames = i
+    clip_frames = (end_frame - start_frame) if end_frame is not None else None
+
+    # Reaproveitamento de frames estáticos: compara com o último frame
+    # efetivamente filtrado (e não com o anterior) para não acumular deriva
+    skip_enabled = skip_threshold > 0
+    if roi is not None:
+        roi_x, roi_y, roi_w, roi_h = roi
+        diff_size = (DIFF_WIDTH, max(DIFF_WIDTH * roi_h // roi_w, 1))
+    else:
+        diff_size = (DIFF_WIDTH, max(DIFF_WIDTH * height // width, 1))
+    reference = None
+    skipped_frames = writer.stats.get('skipped_frames', 0)
     
     # Mostrar progresso apenas a cada 10% do total
-    progress_step = max(frame_count // 10, 30)
-    
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    total_frames = clip_frames or frame_count
+    progress_step = max(total_frames // 10, 30)
+
+    def report_progress(done_frames: int):
+        if total_frames > 0 and done_frames % progress_step == 0:
+            progress = (done_frames / total_frames) * 100
+            print(f"Progresso: {progress:.1f}% ({done_frames}/{total_frames} frames)")
+
+    if workers > 0:
+        written, skipped_frames = _process_frames_multiprocess(
+            cap, writer, filter_name, workers, i, clip_frames, decoded_shape, (height, width, 3),
+            roi, skip_threshold, diff_size, pool,
+            on_frame=collect_preview, on_progress=report_progress,
+            should_stop=should_stop,
+        )
+        processed_frames += written
+    else:
+        while clip_frames is None or i < clip_frames:
+            if should_stop is not None and should_stop():
+                break
+            # Decodifica direto no buffer reutilizável
+            ret, frame = cap.read(pool.get('decoded', decoded_shape))
+            if not ret:
+                break
         
-        # Garantir que frame tem as dimensões corretas
-        if frame.shape[:2] != (height, width):
-            frame = cv2.resize(frame, (width, height))
+            # Garantir que frame tem as dimensões corretas
+            if frame.shape[:2] != (height, width):
+                frame = cv2.resize(frame, (width, height), dst=pool.get('resized', (height, width, 3)))
         
-        # Aplicar filtro
-        try:
-            processed = filter_fn(frame)
-            
-            # Garantir que processed tem as dimensões corretas
-            if processed.shape[:2] != (height, width):
-                processed = cv2.resize(processed, (width, height))
-            
-            # Escrever frame
-            out.write(processed)
-            processed_frames += 1
+            # Com ROI, o filtro vê só uma view da região (sem cópia); o resto
+            # do frame passa direto
+            target = frame if roi is None else frame[roi_y:roi_y + roi_h, roi_x:roi_x + roi_w]
+
+            # Aplicar filtro
+            try:
+                signature = frame_signature(target, diff_size, pool) if skip_enabled else None
+
+                if reference is not None and frame_difference(signature, reference) < skip_threshold:
+                    # Frame praticamente igual: reutiliza a última saída filtrada
+                    # (o buffer 'filtered' do pool ainda guarda essa saída)
+                    skipped_frames += 1
+                else:
+                    filtered = filter_fn(target, pool=pool)
+                    if skip_enabled:
+                        reference = pool.get('reference', signature.shape)
+                        np.copyto(reference, signature)
+
+                    # Garantir que a saída do filtro tem as dimensões corretas
+                    if filtered.shape[:2] != target.shape[:2]:
+                        filtered = cv2.resize(filtered, (target.shape[1], target.shape[0]))
+
+                if roi is None:
+                    processed = filtered
+                else:
+                    # Só os pixels da região são copiados de volta para o frame
+                    target[...] = filtered
+                    processed = frame
             
-            # Salvar thumbnail do primeiro frame processado
-            if not saved_thumb:
-                cv2.imwrite(str(thumb_jpg), processed)
-                saved_thumb = True
+                # Escrever frame (o checkpoint leva junto a contagem de reaproveitados)
+                writer.stats['skipped_frames'] = skipped_frames
+                writer.write(processed)
+                processed_frames += 1
             
-            # Coletar frames para GIF
-            if preview_gif is not None and (i % sample_every == 0) and len(frames_for_gif) < 60:
-                frames_for_gif.append(cv2.cvtColor(processed, cv2.COLOR_BGR2RGB))
+                # Thumbnail e preview
+                collect_preview(processed, i)
             
-        except Exception as e:
-            print(f"Erro ao processar frame {i}: {e}")
-            break
+            except JobCancelled:
+                writer.abort()
+                raise
+            except Exception as e:
+                print(f"Erro ao processar frame {i}: {e}")
+                break
         
-        i += 1
+            i += 1
         
-        # Log de progresso apenas ocasionalmente
-        if frame_count > 0 and i % progress_step == 0:
-            progress = (i / frame_count) * 100
-            print(f"Progresso: {progress:.1f}% ({i}/{frame_count} frames)")
+            # Log de progresso apenas ocasionalmente
+            report_progress(i)
 
     cap.release()
-    out.release()
+    if should_stop is not None and should_stop():
+        writer.abort()
+        raise JobCancelled(f"Processamento de {src_path.name} interrompido após {processed_frames} frames")
+    writer.finish()
+    codec_name = writer.codec
     
     print(f"Processamento concluído: {processed_frames} frames processados")
+    # Estatísticas de diagnóstico; reaproveitados e preview também vão no resultado
+    if DEBUG:
+        print(f"Buffers do pool: {pool.stats()}")
+        if skip_enabled:
+            print(f"Frames reaproveitados: {skipped_frames}/{processed_frames}")
 
-    # Verificar se o arquivo foi criado
-    if not (dst_path.exists() and dst_path.stat().st_size > 0):
-        raise RuntimeError("Vídeo não foi criado corretamente!")
-
-    # Gerar GIF (opcional)
-    if preview_gif is not None and frames_for_gif:
+    # Gerar preview animado (opcional)
+    preview_stats = None
+    if preview is not None and preview_frames.frames:
         try:
-            import imageio
-            preview_gif.parent.mkdir(parents=True, exist_ok=True)
-            imageio.mimsave(str(preview_gif), frames_for_gif, duration=0.5)
+            preview_stats = write_preview(preview_frames.frames, preview)
+            if DEBUG:
+                print(f"Preview: {preview_stats}")
         except Exception as e:
-            print(f"Erro ao criar GIF: {e}")
+            print(f"Erro ao criar preview: {e}")
 
     return {
         'fps': float(fps),
         'width': int(width),
         'height': int(height),
         'frame_count': int(frame_count),
-        'processed_frames': processed_frames
+        'processed_frames': processed_frames,
+        'codec': codec_name,
+        'skipped_frames': skipped_frames,
+        'skip_ratio': skipped_frames / processed_frames if processed_frames else 0.0,
+        'clip_start_sec': start_frame / fps,
+        'clip_end_sec': (start_frame + processed_frames) / fps,
+        'roi': list(roi) if roi is not None else None,
+        'preview': preview_stats,
     }
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+Reconstrói a tabela `videos` a partir da árvore de mídia (recuperação de desastre).
+
+Percorre MEDIA_ROOT/videos/Y/M/D/<id>/ e, para cada vídeo, usa o job.json
+(e o meta.json, quando existir, para o que faltar); o que nenhum dos dois
+trouxer é derivado dos próprios arquivos (caminhos pelo que está no disco,
+quente ou frio; data pelo diretório; fps/dimensões pelo OpenCV). Tudo é
+inserido numa única transação.
+
+Uso:
+    python rebuild_db.py            # insere apenas ids ausentes no banco
+    python rebuild_db.py --replace  # sobrescreve registros existentes
+"""
+import json
+import argparse
+from pathlib import Path
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from config import VIDEOS, MEDIA_ROOT, COLD_ROOT
+from db import init_db, insert_videos, list_video_ids, VIDEO_COLUMNS
+from processing import probe_video
+from utils import guess_mime
+
+
+def iter_video_dirs(videos_root: Path):
+    for video_dir in sorted(videos_root.glob('*/*/*/*')):
+        if video_dir.is_dir() and (video_dir / 'processed').is_dir():
+            yield video_dir
+
+
+def find_preview(video_dir: Path) -> str | None:
+    previews = sorted(video_dir.glob('thumbs/preview.*'))
+    return previews[0].name if previews else None
+
+
+def load_json(path: Path) -> dict | None:
+    if not path.exists():
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"{path.name} inválido em {path.parent}: {e}")
+        return None
+
+
+def find_on_disk(video_dir: Path, pattern: str) -> Path | None:
+    """Procura o arquivo na camada quente e, se não houver, na fria (ver tiering.py)"""
+    for root in (video_dir, COLD_ROOT / video_dir.relative_to(MEDIA_ROOT)):
+        found = sorted(root.glob(pattern))
+        if found:
+            return found[0]
+    return None
+
+
+def resolve_path(recorded: str | None, video_dir: Path, pattern: str) -> Path | None:
+    """Usa o caminho registrado se ele ainda existir; senão o que está no disco"""
+    if recorded and Path(recorded).exists():
+        return Path(recorded)
+    return find_on_disk(video_dir, pattern)
+
+
+def meta_from_dir(video_dir: Path) -> dict | None:
+    # O job.json é o diário do pipeline e sempre existe; o meta.json só é
+    # exportado sob demanda e pode estar ausente ou desatualizado
+    job = load_json(video_dir / 'job.json') or {}
+    meta = load_json(video_dir / 'meta.json') or {}
+    result = job.get('result') or {}
+
+    record = {k: meta.get(k) for k in VIDEO_COLUMNS}
+    for key in ('original_name', 'ext', 'filter', 'created_at'):
+        if job.get(key) is not None:
+            record[key] = job[key]
+    for key in ('fps', 'width', 'height'):
+        if result.get(key) is not None:
+            record[key] = result[key]
+    record['id'] = video_dir.name
+
+    filter_dir = record['filter'] or '*'
+    processed = resolve_path(record['path_processed'], video_dir, f'processed/{filter_dir}/video.*')
+    if processed is None and filter_dir != '*':
+        processed = find_on_disk(video_dir, 'processed/*/video.*')
+    if processed is None:
+        print(f"Sem vídeo processado em {video_dir}, ignorando")
+        return None
+    original = resolve_path(record['path_original'], video_dir, 'original/video.*')
+    record['path_processed'] = str(processed)
+    record['path_original'] = str(original) if original else None
+
+    if record['fps'] is None or record['width'] is None or record['height'] is None:
+        try:
+            info = probe_video(processed)
+        except RuntimeError as e:
+            print(f"Não foi possível ler {processed}: {e}")
+            info = {}
+        record['fps'] = info.get('fps')
+        record['width'] = info.get('width')
+        record['height'] = info.get('height')
+        frames = info.get('frame_count')
+        if record['duration_sec'] is None and record['fps'] and frames:
+            record['duration_sec'] = frames / record['fps']
+    if record['duration_sec'] is None and record['fps'] and result.get('processed_frames'):
+        record['duration_sec'] = result['processed_frames'] / record['fps']
+
+    if record['created_at'] is None:
+        y, m, d = video_dir.parts[-4:-1]
+        created = datetime.fromtimestamp(processed.stat().st_mtime, timezone.utc)
+        if created.strftime('%Y/%m/%d') != f'{y}/{m}/{d}':
+            created = datetime(int(y), int(m), int(d), tzinfo=timezone.utc)
+        record['created_at'] = created.isoformat()
+
+    if record['ext'] is None:
+        record['ext'] = processed.suffix
+    if record['mime_type'] is None:
+        record['mime_type'] = guess_mime(processed)
+    if record['size_bytes'] is None and original is not None:
+        record['size_bytes'] = original.stat().st_size
+    if record['filter'] is None:
+        record['filter'] = processed.parent.name
+    if record['preview_file'] is None:
+        preview = job.get('preview')
+        if preview and (video_dir / 'thumbs' / preview).exists():
+            record['preview_file'] = preview
+        else:
+            # '' = sem preview (ver db._backfill_preview_files)
+            record['preview_file'] = find_preview(video_dir) or ''
+    return record
+
+
+def rebuild(videos_root: Path = VIDEOS, replace: bool = False, workers: int = 8) -> dict:
+    init_db()
+    existing = set() if replace else list_video_ids()
+    dirs = [d for d in iter_video_dirs(videos_root) if d.name not in existing]
+
+    # O OpenCV libera o GIL ao abrir/ler arquivos, então threads bastam
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        metas = [m for m in pool.map(meta_from_dir, dirs) if m]
+
+    inserted = insert_videos(metas, replace=replace)
+    return {'scanned': len(dirs), 'recovered': len(metas), 'inserted': inserted}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstrói videos.db a partir da árvore de mídia")
+    parser.add_argument('--videos-root', type=Path, default=VIDEOS)
+    parser.add_argument('--replace', action='store_true', help="sobrescreve registros existentes")
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    result = rebuild(args.videos_root.resolve(), args.replace, args.workers)
+    print(f"Diretórios analisados: {result['scanned']}, "
+          f"recuperados: {result['recovered']}, inseridos: {result['inserted']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Recuperação de jobs interrompidos na inicialização do servidor.
+
+Um diretório em videos/Y/M/D/<id> sem registro no banco é um job que não
+terminou. Se tiver job.json e os insumos da etapa atual ainda existirem,
+o job é retomado (o processamento continua do último checkpoint); senão
+o diretório vai para a trash. Diretórios legados (sem job.json) só são
+descartados se não tiverem vídeo processado completo; os demais ficam
+para o rebuild_db.py.
+
+Os jobs na fila ou em execução são dos workers e ficam de fora; os
+retomáveis voltam para a fila em vez de rodar neste processo (que, sob o
+gunicorn com preload_app, é o master). No modo fila quem os pega são os
+worker.py; no modo inline, cada worker do servidor web os consome sob a
+própria admissão (ver start_recovered_jobs em app.py).
+
+Com vários processos (workers do gunicorn, outros nós) a varredura de um
+pode cruzar com um upload em andamento noutro, que já gravou em
+incoming/ ou videos/ mas ainda não está no banco nem na fila. Por isso
+só entram arquivos e diretórios sem nenhuma escrita há mais de
+RECOVERY_GRACE_SEC segundos.
+"""
+import os
+import time
+from pathlib import Path
+
+from config import INCOMING, VIDEOS
+from db import list_video_ids
+from pipeline import (
+    load_job, save_job, discard_job, job_paths, STAGE_RECEIVED, STAGE_PROCESSED, STAGE_DONE,
+)
+import jobqueue
+
+RECOVER_ON_STARTUP = bool(int(os.getenv('RECOVER_ON_STARTUP', '1')))
+# Idade mínima (última escrita) para um job/arquivo ser tratado como órfão
+RECOVERY_GRACE_SEC = float(os.getenv('RECOVERY_GRACE_SEC', '300'))
+
+
+def _nonempty(path: Path) -> bool:
+    try:
+        return path.stat().st_size > 0
+    except FileNotFoundError:
+        return False
+
+
+def _can_resume(base: Path, job: dict) -> bool:
+    if job['stage'] == STAGE_RECEIVED:
+        return Path(job['incoming']).exists()
+    paths = job_paths(base, job['ext'], job['filter'])
+    if not _nonempty(paths['original']):
+        return False
+    if job['stage'] in (STAGE_PROCESSED, STAGE_DONE):
+        # Dessas etapas em diante o pipeline não reprocessa: só grava no banco
+        return _nonempty(paths['processed'])
+    return True
+
+
+def _has_processed_video(base: Path) -> bool:
+    return any(p.stat().st_size > 0 for p in base.glob('processed/*/video.*'))
+
+
+def _last_write(path: Path) -> float:
+    """mtime mais recente do caminho e (se for diretório) de tudo dentro dele"""
+    latest = path.stat().st_mtime
+    if path.is_dir():
+        for p in path.rglob('*'):
+            try:
+                latest = max(latest, p.stat().st_mtime)
+            except FileNotFoundError:
+                # .part renomeado durante a varredura
+                continue
+    return latest
+
+
+def sweep_orphans(grace_sec: float = RECOVERY_GRACE_SEC) -> dict:
+    """Classifica os diretórios sem registro no banco; retorna os jobs a retomar"""
+    known = list_video_ids()
+    active = jobqueue.active_ids()
+    known |= active
+    recent_before = time.time() - grace_sec
+    resumable, discarded, legacy, in_flight = [], [], [], []
+
+    for base in sorted(VIDEOS.glob('*/*/*/*')):
+        if not base.is_dir() or base.name in known:
+            continue
+        if _last_write(base) > recent_before:
+            # Pode ser um upload ainda em andamento noutro processo
+            in_flight.append(base.name)
+            continue
+
+        job = load_job(base)
+        if job is None:
+            if _has_processed_video(base):
+                legacy.append(base.name)
+                print(f"Diretório sem registro no banco (use rebuild_db.py): {base}")
+            else:
+                discard_job(base)
+                discarded.append(base.name)
+            continue
+
+        if _can_resume(base, job):
+            if job['stage'] == STAGE_DONE:
+                # Chegou ao fim mas o registro sumiu: só falta gravar no banco
+                job['stage'] = STAGE_PROCESSED
+            resumable.append(job)
+        else:
+            discard_job(base, job)
+            discarded.append(base.name)
+
+    # Uploads recebidos que não chegaram a virar job
+    pending = {Path(job['incoming']).name for job in resumable}
+    for f in INCOMING.iterdir():
+        if f.name in pending or f.stem in active or f.stem in in_flight:
+            continue
+        try:
+            if f.stat().st_mtime <= recent_before:
+                f.unlink()
+        except FileNotFoundError:
+            continue
+
+    return {'resumable': resumable, 'discarded': discarded, 'legacy': legacy, 'in_flight': in_flight}
+
+
+def recover_on_startup():
+    if not RECOVER_ON_STARTUP:
+        return
+    result = sweep_orphans()
+    print(f"Recuperação: {len(result['resumable'])} a retomar, "
+          f"{len(result['discarded'])} descartados, {len(result['legacy'])} legados, "
+          f"{len(result['in_flight'])} recentes ignorados")
+    for job in result['resumable']:
+        # O worker relê o job.json: grava a etapa ajustada pela varredura
+        save_job(job)
+        jobqueue.enqueue(job)
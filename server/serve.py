@@ -0,0 +1,84 @@
+"""
+Servidor de produção (gunicorn, multiprocesso).
+
+Uso:
+    python serve.py                # workers = núcleos disponíveis
+    WORKERS=8 THREADS=4 python serve.py
+
+Em SIGTERM o gunicorn para de aceitar conexões e espera até
+GRACEFUL_TIMEOUT segundos pelos uploads em andamento antes de encerrar.
+"""
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from config import HOST, PORT
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def auto_workers() -> int:
+    # O processamento é CPU-bound e roda dentro da requisição de upload:
+    # um worker por núcleo; as threads atendem listagens e mídia em paralelo
+    return int(os.getenv('WORKERS', '0')) or available_cpus()
+
+
+class ProductionServer(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # preload_app: roda uma vez no master, antes do fork
+        from app import create_app
+        return create_app()
+
+
+def post_worker_init(worker):
+    # Jobs interrompidos rodam nos workers, sob a admissão de cada um (ver recovery.py)
+    from app import start_recovered_jobs
+    start_recovered_jobs()
+
+
+def on_worker_exit(server, worker):
+    server.log.info("Worker %s finalizado após drenar as requisições", worker.pid)
+
+
+def main():
+    workers = auto_workers()
+
+    # Os orçamentos de admissão são por processo: divide os núcleos e a memória entre os workers
+    os.environ.setdefault('ADMISSION_MAX_JOBS', str(max(available_cpus() // workers, 1)))
+    host_memory_mb = int(os.getenv('ADMISSION_MAX_MEMORY_MB', '2048'))
+    os.environ['ADMISSION_MAX_MEMORY_MB'] = str(max(host_memory_mb // workers, 1))
+    # As threads do OpenCV também (ver app.init_storage)
+    os.environ['SERVER_PROCESSES'] = str(workers)
+
+    options = {
+        'bind': f'{HOST}:{PORT}',
+        'workers': workers,
+        'worker_class': 'gthread',
+        'threads': int(os.getenv('THREADS', '4')),
+        'preload_app': True,
+        'graceful_timeout': int(os.getenv('GRACEFUL_TIMEOUT', '120')),
+        'timeout': int(os.getenv('WORKER_TIMEOUT', '300')),
+        'keepalive': 5,
+        'accesslog': '-',
+        'post_worker_init': post_worker_init,
+        'worker_exit': on_worker_exit,
+    }
+    print(f"Iniciando gunicorn em {options['bind']} com {workers} workers x {options['threads']} threads")
+    ProductionServer(options).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Camadas de armazenamento dos vídeos originais.
+
+O original re-encodado (videos/Y/M/D/<id>/original/video.ext) quase nunca
+é servido depois do processamento, mas ocupa o disco quente para sempre.
+A política move para COLD_ROOT (mesmo caminho relativo) os originais:
+
+  - sem acesso há TIER_AFTER_DAYS dias (ou desde a criação), ou
+  - criados há mais de TIER_RARE_AFTER_DAYS dias e servidos menos de
+    TIER_RARE_HITS vezes.
+
+Com --recompress (ou TIER_RECOMPRESS=1) a cópia fria é recodificada com o
+codec que gerou o menor arquivo na sonda de encoders.py, e só é mantida
+se ficar menor. path_original no banco sempre aponta para a cópia
+vigente; as URLs públicas não mudam e serve_media restaura o original
+para a camada quente no primeiro acesso.
+
+Uso:
+    python tiering.py                 # aplica a política
+    python tiering.py --dry-run       # só lista os candidatos
+    python tiering.py --recompress    # recodifica ao mover
+    python tiering.py --restore <id>  # traz um original de volta
+    python tiering.py --report        # bytes economizados e restaurações
+"""
+import os
+import re
+import time
+import shutil
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+import cv2
+
+from config import MEDIA_ROOT, COLD_ROOT
+from db import (
+    get_video, list_tier_candidates, set_original_location,
+    record_original_access, record_original_restore, original_storage_report,
+)
+from encoders import probe_encoders
+from utils import part_path
+
+TIER_AFTER_DAYS = float(os.getenv('TIER_AFTER_DAYS', '30'))
+TIER_RARE_AFTER_DAYS = float(os.getenv('TIER_RARE_AFTER_DAYS', '7'))
+TIER_RARE_HITS = int(os.getenv('TIER_RARE_HITS', '1'))
+TIER_RECOMPRESS = bool(int(os.getenv('TIER_RECOMPRESS', '0')))
+
+# Caminho público de um original, como gerado por app.public_urls
+# (os componentes de data podem vir como * no fallback de media_subdir)
+_ORIGINAL_URL = re.compile(r'^videos/[^/]+/[^/]+/[^/]+/([^/]+)/original/video\.\w+$')
+
+# fourccs que o FFmpeg reporta para o mesmo codec (MPEG-4 Part 2, H.264)
+_CODEC_FAMILY = {'fmp4': 'mp4v', 'xvid': 'mp4v', 'divx': 'mp4v', 'h264': 'avc1', 'x264': 'avc1'}
+
+# Evita duas restaurações simultâneas do mesmo vídeo neste processo
+_restore_lock = threading.Lock()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _cold_prefix() -> str:
+    return f'{COLD_ROOT}{os.sep}'
+
+
+def is_cold(path: Path) -> bool:
+    return path.is_relative_to(COLD_ROOT)
+
+
+def cold_path_for(hot_path: Path) -> Path:
+    return COLD_ROOT / hot_path.relative_to(MEDIA_ROOT)
+
+
+def hot_path_for(cold_path: Path) -> Path:
+    return MEDIA_ROOT / cold_path.relative_to(COLD_ROOT)
+
+
+def original_video_id(subpath: str) -> str | None:
+    """id do vídeo se `subpath` (relativo a MEDIA_ROOT) for um original"""
+    match = _ORIGINAL_URL.match(subpath)
+    return match.group(1) if match else None
+
+
+def smallest_codec(ext: str) -> str | None:
+    """fourcc que gerou o menor arquivo na sonda para o container"""
+    probes = probe_encoders()['containers'].get(ext.lower(), {}).get('probes', [])
+    working = [p for p in probes if p['ok']]
+    if not working:
+        return None
+    return min(working, key=lambda p: p['bytes'])['fourcc']
+
+
+def codec_family(fourcc: str | None) -> str | None:
+    if not fourcc:
+        return None
+    return _CODEC_FAMILY.get(fourcc.lower(), fourcc.lower())
+
+
+def video_fourcc(path: Path) -> str | None:
+    cap = cv2.VideoCapture(str(path))
+    code = int(cap.get(cv2.CAP_PROP_FOURCC)) if cap.isOpened() else 0
+    cap.release()
+    return code.to_bytes(4, 'little').decode('latin-1') if code else None
+
+
+def recompress(src: Path, dst: Path, fourcc: str) -> bool:
+    """Recodifica src em dst (mesmo fps/dimensões) com o fourcc dado"""
+    cap = cv2.VideoCapture(str(src))
+    if not cap.isOpened():
+        return False
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    out = cv2.VideoWriter(str(dst), cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    if not out.isOpened():
+        cap.release()
+        return False
+
+    frames = 0
+    frame = None
+    while True:
+        ret, frame = cap.read(frame)
+        if not ret:
+            break
+        out.write(frame)
+        frames += 1
+    cap.release()
+    out.release()
+    return frames > 0 and dst.exists() and dst.stat().st_size > 0
+
+
+def demote(video: dict, recompress_original: bool = TIER_RECOMPRESS) -> dict:
+    """
+    Move o original para a camada fria. A cópia fria é gravada e
+    renomeada antes de o banco apontar para ela; só então o arquivo
+    quente é apagado.
+    """
+    hot = Path(video['path_original'])
+    cold = cold_path_for(hot)
+    cold.parent.mkdir(parents=True, exist_ok=True)
+    tmp = part_path(cold)
+    hot_bytes = hot.stat().st_size
+
+    codec = None
+    if recompress_original:
+        fourcc = smallest_codec(hot.suffix)
+        # Já gravado com o codec mais compacto: recodificar só perderia qualidade
+        if fourcc and codec_family(fourcc) != codec_family(video_fourcc(hot)) \
+                and recompress(hot, tmp, fourcc) and tmp.stat().st_size < hot_bytes:
+            codec = fourcc
+        else:
+            tmp.unlink(missing_ok=True)
+    if codec is None:
+        shutil.copyfile(hot, tmp)
+    os.replace(tmp, cold)
+
+    cold_bytes = cold.stat().st_size
+    set_original_location(
+        video['id'], str(cold),
+        moved_at=_now(), hot_bytes=hot_bytes, cold_bytes=cold_bytes, codec=codec,
+    )
+    hot.unlink(missing_ok=True)
+    return {'id': video['id'], 'hot_bytes': hot_bytes, 'cold_bytes': cold_bytes, 'codec': codec}
+
+
+def restore_original(video_id: str) -> Path | None:
+    """
+    Garante o original na camada quente e retorna o caminho
+    (None se o vídeo ou o arquivo não existirem).
+    """
+    with _restore_lock:
+        video = get_video(video_id)
+        if not video or not video.get('path_original'):
+            return None
+        current = Path(video['path_original'])
+        if not is_cold(current):
+            return current if current.exists() else None
+
+        hot = hot_path_for(current)
+        if not current.exists():
+            # Outro processo restaurou entre a leitura do banco e agora
+            return hot if hot.exists() else None
+
+        t0 = time.perf_counter()
+        hot.parent.mkdir(parents=True, exist_ok=True)
+        # part_path é por processo: workers do gunicorn podem restaurar juntos
+        tmp = part_path(hot)
+        shutil.copyfile(current, tmp)
+        os.replace(tmp, hot)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+
+        record_original_restore(video_id, str(hot), elapsed_ms, _now())
+        current.unlink(missing_ok=True)
+        print(f"Original de {video_id} restaurado da camada fria em {elapsed_ms:.1f} ms")
+        return hot
+
+
+def record_access(video_id: str):
+    record_original_access(video_id, _now())
+
+
+def candidates(now: datetime | None = None) -> list[dict]:
+    now = now or datetime.now(timezone.utc)
+    idle_before = (now - timedelta(days=TIER_AFTER_DAYS)).isoformat()
+    rare_before = (now - timedelta(days=TIER_RARE_AFTER_DAYS)).isoformat()
+    return list_tier_candidates(_cold_prefix(), idle_before, rare_before, TIER_RARE_HITS)
+
+
+def apply_policy(dry_run: bool = False, recompress_original: bool = TIER_RECOMPRESS,
+                 now: datetime | None = None) -> dict:
+    moved, missing, skipped = [], [], []
+    for video in candidates(now):
+        if not Path(video['path_original']).is_relative_to(MEDIA_ROOT):
+            # Registro legado com o original fora de MEDIA_ROOT: sem caminho frio correspondente
+            skipped.append(video['id'])
+            continue
+        if not Path(video['path_original']).exists():
+            missing.append(video['id'])
+            continue
+        if dry_run:
+            moved.append({'id': video['id'], 'hot_bytes': Path(video['path_original']).stat().st_size})
+            continue
+        try:
+            moved.append(demote(video, recompress_original))
+        except (OSError, ValueError) as e:
+            print(f"Erro ao mover original de {video['id']}: {e}")
+
+    hot_bytes = sum(m['hot_bytes'] for m in moved)
+    cold_bytes = sum(m.get('cold_bytes', m['hot_bytes']) for m in moved)
+    return {
+        'dry_run': dry_run,
+        'moved': len(moved),
+        'missing': missing,
+        'skipped': skipped,
+        'hot_bytes_freed': hot_bytes,
+        'recompression_saved_bytes': hot_bytes - cold_bytes,
+        'videos': moved,
+    }
+
+
+def storage_report() -> dict:
+    report = original_storage_report(_cold_prefix())
+    report['recompression_saved_bytes'] = report['hot_bytes'] - report['cold_bytes']
+    report['cold_root'] = str(COLD_ROOT)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move originais pouco usados para a camada fria")
+    parser.add_argument('--dry-run', action='store_true', help="só lista os candidatos")
+    parser.add_argument('--recompress', action='store_true', default=TIER_RECOMPRESS,
+                        help="recodifica com o codec de menor arquivo da sonda")
+    parser.add_argument('--restore', metavar='VIDEO_ID', help="traz um original de volta")
+    parser.add_argument('--report', action='store_true', help="resumo da camada fria")
+    args = parser.parse_args()
+
+    if args.restore:
+        path = restore_original(args.restore)
+        print(f"Original em: {path}" if path else "Original não encontrado")
+        return
+    if args.report:
+        print(storage_report())
+        return
+
+    result = apply_policy(args.dry_run, args.recompress)
+    print(f"Originais {'candidatos' if args.dry_run else 'movidos'}: {result['moved']}, "
+          f"liberados {result['hot_bytes_freed'] / 2**20:.1f} MiB no disco quente, "
+          f"recompressão economizou {result['recompression_saved_bytes'] / 2**20:.1f} MiB")
+    if result['missing']:
+        print(f"Sem arquivo original: {', '.join(result['missing'])}")
+    if result['skipped']:
+        print(f"Originais fora de MEDIA_ROOT (ignorados): {', '.join(result['skipped'])}")
+
+
+if __name__ == "__main__":
+    main()
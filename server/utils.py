@@ -1,3 +1,8 @@
+import os
+import re
+import json
+import time
+import socket
 import hashlib
 from datetime import datetime
 import mimetypes
@@ -5,6 +10,12 @@ from pathlib import Path
 
 ALLOWED_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv'}
 
+# Temporários de outro host não dá para checar pelo pid: só são apagados
+# depois de tanto tempo sem escrita
+STALE_PART_SEC = 3600
+
+_PART_OWNER = re.compile(r'\.([^.]+)-(\d+)\.part(\.[^.]*)?$')
+
 def now_parts():
     dt = datetime.utcnow()
     return dt, dt.strftime('%Y'), dt.strftime('%m'), dt.strftime('%d')
@@ -25,4 +36,56 @@ def sha256sum(path: Path, bufsize: int = 1 << 20) -> str:
 
 def guess_mime(path: Path) -> str:
     mt, _ = mimetypes.guess_type(str(path))
-    return mt or 'application/octet-stream'
\ No newline at end of file
+    return mt or 'application/octet-stream'
+
+def _part_owner() -> str:
+    return f"{socket.gethostname().replace('.', '_').replace('-', '_')}-{os.getpid()}"
+
+def part_path(path: Path) -> Path:
+    """
+    Caminho temporário ao lado do destino, mantendo a extensão (OpenCV/imageio usam-na).
+    Leva host e pid: dois processos gravando o mesmo destino (workers da
+    fila durante a troca de lease) nunca escrevem no mesmo arquivo temporário.
+    """
+    return path.with_name(f'.{path.stem}.{_part_owner()}.part{path.suffix}')
+
+def is_part(path: Path) -> bool:
+    return path.name.startswith('.') and '.part' in path.name
+
+def part_is_stale(part: Path) -> bool:
+    """
+    True se o processo dono do temporário não existe mais: neste host pelo
+    pid; em outro host, se o arquivo está sem escrita há STALE_PART_SEC
+    """
+    match = _PART_OWNER.search(part.name)
+    if match is None:
+        # Formato antigo, sem dono
+        return True
+    host, pid = match.group(1), int(match.group(2))
+    if host != _part_owner().rsplit('-', 1)[0]:
+        try:
+            return time.time() - part.stat().st_mtime > STALE_PART_SEC
+        except FileNotFoundError:
+            return False
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+def remove_stale_parts(path: Path):
+    """Apaga temporários de `path` deixados por processos que morreram"""
+    for part in path.parent.glob(f'.{path.stem}.*.part{path.suffix}'):
+        if part_is_stale(part):
+            part.unlink(missing_ok=True)
+
+def write_json_atomic(path: Path, data: dict):
+    """Grava JSON num arquivo temporário e renomeia: leitores nunca veem metade do arquivo"""
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.part')
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp, path)
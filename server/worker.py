@@ -0,0 +1,195 @@
+"""
+Worker de processamento do modo fila (PROCESSING_MODE=queue).
+
+Não guarda estado próprio: pega um job da fila (jobqueue.py), executa
+pipeline.run_job sobre o MEDIA_ROOT compartilhado e grava o resultado no
+videos.db. Para mais vazão, suba mais workers (no mesmo host ou em
+outros que montem o mesmo MEDIA_ROOT/DB_PATH); cada um processa um job
+por vez usando todos os núcleos do OpenCV.
+
+Em SIGTERM/SIGINT o worker termina o job atual e sai. Se for morto no
+meio de um job, o lease vence e outro worker retoma o job do último
+checkpoint. Um worker que perde o lease (ficou sem renovar a tempo)
+interrompe o job no próximo frame e não grava mais nada: o job.json e o
+banco só são atualizados depois de confirmar que o lease ainda é dele.
+
+No modo inline não há workers dedicados: a recuperação põe na fila os
+jobs interrompidos e cada worker do servidor web os consome numa thread
+(resume_recovered), sob o controle de admissão do próprio processo.
+
+Uso:
+    python worker.py            # processa até SIGTERM
+    python worker.py --drain    # sai quando a fila esvaziar
+    python worker.py --once     # no máximo um job
+"""
+import os
+import signal
+import argparse
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+from config import MEDIA_ROOT, INCOMING, TRASH, VIDEOS, WRITE_META_JSON
+from db import init_db
+from encoders import probe_encoders
+from kernels import select_kernels, configure_threads
+from pipeline import load_job, run_job, discard_job, job_paths, STAGE_RECEIVED
+from processing import JobCancelled, probe_video, clip_bounds
+from admission import AdmissionRejected, estimate_cost
+from utils import write_json_atomic
+import jobqueue
+
+# Intervalo entre consultas à fila vazia
+WORKER_POLL_SEC = float(os.getenv('WORKER_POLL_SEC', '1.0'))
+
+_stop = threading.Event()
+
+
+def discard_expired():
+    """Descarta os jobs cujo worker morreu na última tentativa"""
+    for item in jobqueue.expire():
+        print(f"Job {item['id']} esgotou {item['attempts']} tentativas; descartando")
+        discard_job(Path(item['base']), load_job(Path(item['base'])))
+
+
+def job_cost(job: dict) -> dict:
+    """Custo do job para a admissão; como no upload, só os frames do trecho contam"""
+    if job['stage'] == STAGE_RECEIVED:
+        source = Path(job['incoming'])
+    else:
+        source = job_paths(Path(job['base']), job['ext'], job['filter'])['original']
+    info = probe_video(source)
+    start_frame, end_frame, _ = clip_bounds(info, job.get('start_sec'), job.get('end_sec'))
+    if end_frame is not None or start_frame:
+        info = dict(info, frame_count=(end_frame or info['frame_count']) - start_frame)
+    return estimate_cost(info)
+
+
+@contextmanager
+def admitted(admission, job: dict, heartbeat):
+    """Ocupa uma vaga da admissão enquanto o job roda (sem admissão, não faz nada)"""
+    if admission is None:
+        yield
+        return
+    cost = job_cost(job)
+    while True:
+        try:
+            ticket = admission.acquire(job['id'], cost)
+            break
+        except AdmissionRejected as e:
+            # O heartbeat segue renovando o lease enquanto espera
+            if _stop.wait(e.retry_after) or heartbeat.lost:
+                raise JobCancelled("sem vaga na admissão")
+    try:
+        yield
+    finally:
+        admission.release(ticket)
+
+
+def process_one(worker: str, admission=None) -> bool:
+    """
+    Executa um job da fila; retorna False se a fila estava vazia.
+    Com `admission` (AdmissionController) o job espera uma vaga antes de rodar.
+    """
+    discard_expired()
+    item = jobqueue.claim(worker)
+    if item is None:
+        return False
+
+    base = Path(item['base'])
+    job = load_job(base)
+    if job is None:
+        # Diretório sumiu (vídeo apagado ou job descartado pela recuperação)
+        print(f"Job {item['id']} sem job.json em {base}")
+        jobqueue.fail(item, worker, "job.json ausente", retry=False)
+        return True
+
+    print(f"Worker {worker}: job {item['id']} (tentativa {item['attempts']}, etapa {job['stage']})")
+    with jobqueue.Heartbeat(item['id'], worker) as heartbeat:
+        def ensure_owner():
+            # UPDATE condicional: só passa se o job ainda for deste worker
+            if heartbeat.lost or not jobqueue.renew(item['id'], worker):
+                # should_stop também passa a ver a perda (threads do pipeline)
+                heartbeat.lost = True
+                raise JobCancelled("lease perdido")
+
+        try:
+            with admitted(admission, job, heartbeat):
+                meta = run_job(job, should_stop=lambda: heartbeat.lost, ensure_owner=ensure_owner)
+        except JobCancelled as e:
+            # O job já é de outro worker: não mexe na fila nem no diretório
+            print(f"Job {item['id']} abandonado por {worker}: {e}")
+            return True
+        except Exception as e:
+            if heartbeat.lost:
+                print(f"Job {item['id']} abandonado por {worker} após perder o lease: {e}")
+                return True
+            print(f"Erro no job {item['id']}: {e}")
+            state = jobqueue.fail(item, worker, str(e))
+            if state == 'failed':
+                discard_job(base, job)
+            return True
+
+    if WRITE_META_JSON:
+        write_json_atomic(job_paths(base, job['ext'], job['filter'])['meta_json'], meta)
+    if jobqueue.complete(item['id'], worker):
+        print(f"Job {item['id']} concluído por {worker}")
+    else:
+        print(f"Job {item['id']} concluído, mas o lease já era de outro worker")
+    return True
+
+
+def run(drain: bool = False, once: bool = False):
+    worker = jobqueue.worker_id()
+    print(f"Worker {worker} aguardando jobs (lease {jobqueue.QUEUE_LEASE_SEC:.0f}s)")
+    while not _stop.is_set():
+        if process_one(worker):
+            if once:
+                return
+            continue
+        if drain or once:
+            return
+        _stop.wait(WORKER_POLL_SEC)
+
+
+def resume_recovered(admission):
+    """
+    Modo inline: processa neste processo os jobs que a recuperação pôs na
+    fila, um por vez e sob `admission`; sai quando a fila esvaziar. Jobs de
+    um worker morto voltam a ser entregues quando o lease vence.
+    """
+    worker = jobqueue.worker_id()
+    while not _stop.is_set() and jobqueue.active_ids():
+        if not process_one(worker, admission):
+            _stop.wait(WORKER_POLL_SEC)
+
+
+def init_worker():
+    for p in (MEDIA_ROOT, INCOMING, TRASH, VIDEOS):
+        p.mkdir(parents=True, exist_ok=True)
+    init_db()
+    probe_encoders()
+    # Um job por vez: o OpenCV pode usar todos os núcleos
+    configure_threads(1)
+    select_kernels()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Processa jobs da fila compartilhada")
+    parser.add_argument('--drain', action='store_true', help="sai quando a fila esvaziar")
+    parser.add_argument('--once', action='store_true', help="processa no máximo um job")
+    args = parser.parse_args()
+
+    def stop(signum, frame):
+        print("Encerrando após o job atual...")
+        _stop.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    init_worker()
+    run(drain=args.drain, once=args.once)
+
+
+if __name__ == "__main__":
+    main()